@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Benchmark flatten_vault_structure on synthetic vault trees.
+
+Compares the iterative flattener in infralib/load_secrets.py with the
+recursive implementation it replaced, reporting wall time, peak traced
+memory and the transient part of that peak (memory not retained by the
+result) per tree shape. Both must produce the same paths in the same order.
+Run from the repository root:
+
+    python3 benchmarks/bench_flatten.py --leaves 100000
+"""
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from infralib.load_secrets import flatten_vault_structure
+
+
+def recursive_flatten(data, current_path="", result=None):
+    """The recursive flattener load_secrets.py used before, kept as a baseline"""
+    if result is None:
+        result = {}
+
+    if isinstance(data, dict):
+        for key, value in data["vault"].items():
+            if isinstance(value, dict):
+                recursive_process_path_data(key, value, "", result)
+            else:
+                result[key] = {key: value}
+
+    return result
+
+
+def recursive_process_path_data(path_segment, path_data, current_path, result):
+    path = f"{current_path}/{path_segment}" if current_path else path_segment
+
+    if isinstance(path_data, dict):
+        if not any(isinstance(v, dict) for v in path_data.values()):
+            result[path] = path_data
+        else:
+            for key, value in path_data.items():
+                recursive_process_path_data(key, value, path, result)
+
+
+def build_tree(leaves, fanout, depth, secrets_per_path=1):
+    """Vault document with `leaves` secret paths spread `fanout` wide over `depth` levels"""
+    root = {}
+    paths = leaves // secrets_per_path
+    for i in range(paths):
+        node = root
+        n = i
+        for level in range(depth - 1):
+            segment = f"d{level}-{n % fanout}"
+            n //= fanout
+            node = node.setdefault(segment, {})
+        node[f"secret-{i}"] = {f"KEY_{j}": f"value-{i}-{j}" for j in range(secrets_per_path)}
+    return {'vault': {'kv': root}}
+
+
+def build_chain(depth):
+    """A single secret nested `depth` levels deep"""
+    node = {'KEY': 'value'}
+    for level in range(depth):
+        node = {f"level-{level}": node}
+    return {'vault': {'kv': node}}
+
+
+def measure(flatten, tree, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = flatten(tree)
+        best = min(best, time.perf_counter() - start)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = flatten(tree)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, peak - retained, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark vault tree flattening')
+    parser.add_argument('--leaves', type=int, default=100000,
+                       help='Number of leaf secrets per synthetic tree (default: 100000)')
+    parser.add_argument('--repeat', type=int, default=5,
+                       help='Timing runs per implementation; the best is reported (default: 5)')
+    parser.add_argument('--chain-depth', type=int, default=5000,
+                       help='Depth of the single-path tree used to probe the recursion limit')
+    args = parser.parse_args()
+
+    shapes = [
+        ('wide (1 level)', build_tree(args.leaves, args.leaves, 1)),
+        ('balanced (fanout 10)', build_tree(args.leaves, 10, 5)),
+        ('narrow (fanout 2)', build_tree(args.leaves, 2, 16)),
+        ('multi-key paths', build_tree(args.leaves, 10, 4, secrets_per_path=10)),
+        (f'chain (depth {args.chain_depth})', build_chain(args.chain_depth)),
+    ]
+
+    print(f"{'shape':<24} {'impl':<10} {'paths':>8} {'best time':>11} {'peak mem':>11} {'transient':>11}")
+    for name, tree in shapes:
+        results = {}
+        for impl, flatten in (('recursive', recursive_flatten), ('iterative', flatten_vault_structure)):
+            try:
+                elapsed, peak, transient, results[impl] = measure(flatten, tree, args.repeat)
+            except RecursionError:
+                print(f"{name:<24} {impl:<10} {'RecursionError':>32}")
+                continue
+            print(f"{name:<24} {impl:<10} {len(results[impl]):>8} {elapsed * 1000:>9.1f}ms "
+                  f"{peak / 1024:>8.0f}KiB {transient / 1024:>8.0f}KiB")
+
+        if len(results) == 2 and list(results['recursive'].items()) != list(results['iterative'].items()):
+            print(f"{name:<24} MISMATCH between implementations")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Vault scripts against the in-process KV v2 stand-in.
+
+Seeds infralib.fake_vault.FakeVault with synthetic secrets and reports
+paths/sec for listing (get_secrets_paths) and extraction (extract_secret
+into a temporary directory) in secrets_extract.py, and updates/sec for the
+kubeconfig merge-and-write cycle of both updaters. --latency simulates the
+round trip to the real server, which is what concurrency hides.
+Run from the repository root:
+
+    python3 benchmarks/bench_vault.py --secrets 1000 10000 50000 --concurrency 1 8 --latency 0.002
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import secrets_extract
+from infralib import yaml_codec
+from infralib.fake_vault import FakeVault, generate_secrets
+from infralib.vault_scheduler import RequestScheduler, vault_client
+
+
+def load_script(name, path):
+    """Import a script that is not part of a package"""
+    spec = importlib.util.spec_from_file_location(name, ROOT / path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def cluster_kubeconfig(index):
+    """A kubeconfig as the cluster tooling writes it, with a certificate-sized payload"""
+    name = f"cluster-{index}"
+    return yaml_codec.dump({
+        'apiVersion': 'v1',
+        'kind': 'Config',
+        'clusters': [{'name': name, 'cluster': {'server': f"https://10.0.{index // 256}.{index % 256}:6443",
+                                                'certificate-authority-data': 'A' * 1500}}],
+        'contexts': [{'name': name, 'context': {'cluster': name, 'user': name}}],
+        'users': [{'name': name, 'user': {'client-certificate-data': 'B' * 1500,
+                                          'client-key-data': 'C' * 1600}}],
+        'current-context': name,
+    })
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def bench_list(vault, concurrency):
+    client = vault_client(vault.url, vault.token, RequestScheduler(max_concurrency=concurrency))
+    elapsed, (paths, errors) = timed(lambda: secrets_extract.get_secrets_paths(client, concurrency=concurrency))
+    assert not errors and len(paths) == len(vault.paths())
+    return elapsed, paths
+
+
+def bench_extract(vault, paths, concurrency):
+    client = vault_client(vault.url, vault.token, RequestScheduler(max_concurrency=concurrency))
+    router = secrets_extract.load_router()
+    with tempfile.TemporaryDirectory() as output_dir:
+        jobs = [router.job(path, output_dir) for path in paths]
+
+        def run():
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                return list(executor.map(lambda job: secrets_extract.extract_secret(client, *job), jobs))
+
+        # extract_secret logs every path; keep that out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed, written = timed(run)
+    assert all(written)
+    return elapsed
+
+
+def bench_talos_updates(vault, updates):
+    module = load_script('update_talos_kubeconfig', 'clusters/scripts/update_talos_kubeconfig.py')
+    updater = module.TalosKubeconfigUpdater(vault.url, vault.token, management_context='bench')
+    vault_path = f"{vault.mount}/bench/talos/kubeconfig"
+
+    def run():
+        for index in range(updates):
+            name = f"cluster-{index}"
+            kubeconfig = cluster_kubeconfig(index)
+            outcome = updater.publish_kubeconfig(vault_path, 'KUBECONFIG',
+                                                 lambda existing: updater.merge_kubeconfig(existing, kubeconfig, name))
+            assert outcome == module.UPDATED
+
+    return timed(run)[0]
+
+
+def bench_init_updates(vault, updates):
+    module = load_script('update_kubeconfig', 'init/scripts/update_kubeconfig.py')
+    updater = module.KubeconfigUpdater(vault.url, vault.token)
+    vault_path = f"{vault.mount}/bench/init/kubeconfig"
+
+    with tempfile.TemporaryDirectory() as workdir:
+        files = []
+        for index in range(updates):
+            files.append(os.path.join(workdir, f"cluster-{index}.yaml"))
+            with open(files[-1], 'w') as f:
+                f.write(cluster_kubeconfig(index))
+
+        def run():
+            for index, kubeconfig_file in enumerate(files):
+                assert updater.update_kubeconfig(kubeconfig_file, vault_path,
+                                                 f"cluster-{index}", f"cluster-{index}")
+
+        return timed(run)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Vault scripts against a local KV v2 stand-in')
+    parser.add_argument('--secrets', type=int, nargs='+', default=[1000, 10000, 50000],
+                       help='Tree sizes to seed (default: 1000 10000 50000)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8],
+                       help='Worker counts to list and extract with (default: 1 8)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                       help='Seconds the stand-in adds to every request (default: 0)')
+    parser.add_argument('--updates', type=int, default=100,
+                       help='Clusters merged into one kubeconfig secret per updater (default: 100)')
+    parser.add_argument('--skip-extract-above', type=int, default=10000,
+                       help='Only list trees larger than this, extraction writes one file per secret (default: 10000)')
+    args = parser.parse_args()
+
+    # The updaters log every step at INFO
+    logging.disable(logging.INFO)
+
+    print(f"{'secrets':>8} {'workers':>7} {'list':>10} {'paths/s':>9} {'extract':>10} {'paths/s':>9}")
+    for count in args.secrets:
+        with FakeVault(latency=args.latency) as vault:
+            vault.seed(generate_secrets(count))
+            for concurrency in args.concurrency:
+                list_time, paths = bench_list(vault, concurrency)
+                line = f"{count:>8} {concurrency:>7} {list_time:>9.2f}s {count / list_time:>9.0f}"
+                if count <= args.skip_extract_above:
+                    extract_time = bench_extract(vault, paths, concurrency)
+                    line += f" {extract_time:>9.2f}s {count / extract_time:>9.0f}"
+                print(line, flush=True)
+
+    print()
+    print(f"{'updater':<10} {'updates':>7} {'time':>10} {'updates/s':>10} {'final size':>11}")
+    with FakeVault(latency=args.latency) as vault:
+        for name, bench, key in (('talos', bench_talos_updates, 'bench/talos/kubeconfig'),
+                                 ('init', bench_init_updates, 'bench/init/kubeconfig')):
+            elapsed = bench(vault, args.updates)
+            size = len(vault.read(key)['KUBECONFIG'])
+            print(f"{name:<10} {args.updates:>7} {elapsed:>9.2f}s {args.updates / elapsed:>10.1f} "
+                  f"{size / 1024:>8.0f}KiB")
+
+
+if __name__ == "__main__":
+    main()
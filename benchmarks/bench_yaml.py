@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark infralib.yaml_codec's LibYAML path against pure-Python PyYAML.
+
+Times parsing and emitting of the documents the scripts handle: merged
+kubeconfigs with base64 certificate blobs (the kubeconfig updaters and
+pr_kubeconfig_manager.sh) and vault.kv secret trees (secrets_extract.py
+and load_secrets.py). Both paths must read back the same data.
+Run from the repository root:
+
+    python3 benchmarks/bench_yaml.py --clusters 50 --secrets 5000
+"""
+
+import argparse
+import base64
+import os
+import sys
+import time
+from pathlib import Path
+
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from infralib import yaml_codec
+from infralib.fake_vault import generate_secrets
+
+
+def blob(size):
+    """Base64 text of `size` random bytes, like embedded certificate data"""
+    return base64.b64encode(os.urandom(size)).decode()
+
+
+def merged_kubeconfig(clusters):
+    """Kubeconfig holding `clusters` clusters, as the updaters build it"""
+    names = [f"cluster-{i}" for i in range(clusters)]
+    return {
+        'apiVersion': 'v1',
+        'kind': 'Config',
+        'clusters': [{'name': name, 'cluster': {'server': f"https://{name}.homelabz.eu:6443",
+                                                'certificate-authority-data': blob(1100)}}
+                     for name in names],
+        'contexts': [{'name': name, 'context': {'cluster': name, 'user': name, 'namespace': 'default'}}
+                     for name in names],
+        'users': [{'name': name, 'user': {'client-certificate-data': blob(1150),
+                                          'client-key-data': blob(1200)}}
+                  for name in names],
+        'current-context': names[-1],
+        'preferences': {},
+    }
+
+
+def secret_tree(count):
+    """vault.kv document with `count` secrets, as load_secrets.py reads it"""
+    root = {}
+    for path, data in generate_secrets(count, keys=5).items():
+        node = root
+        *dirs, leaf = path.split('/')
+        for part in dirs:
+            node = node.setdefault(part, {})
+        node[leaf] = data
+    return {'vault': {'kv': root}}
+
+
+def best_of(repeat, fn):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare LibYAML and pure-Python YAML on kubeconfigs and secret trees')
+    parser.add_argument('--clusters', type=int, default=50,
+                       help='Clusters in the merged kubeconfig (default: 50)')
+    parser.add_argument('--secrets', type=int, default=5000,
+                       help='Secrets in the vault.kv tree (default: 5000)')
+    parser.add_argument('--repeat', type=int, default=5,
+                       help='Timing runs per case; the best is reported (default: 5)')
+    args = parser.parse_args()
+
+    if not yaml_codec.LIBYAML:
+        print("PyYAML was built without LibYAML; both columns use pure Python")
+
+    implementations = {
+        'pure': (yaml.SafeLoader, yaml.SafeDumper),
+        'libyaml': (yaml_codec.SafeLoader, yaml_codec.SafeDumper),
+    }
+    documents = [
+        (f'kubeconfig ({args.clusters} clusters)', merged_kubeconfig(args.clusters)),
+        (f'secret tree ({args.secrets} secrets)', secret_tree(args.secrets)),
+    ]
+
+    print(f"{'document':<30} {'size':>9} {'impl':<8} {'load':>10} {'dump':>10} {'speedup':>8}")
+    for name, data in documents:
+        text = yaml_codec.dump(data, dumper=yaml.SafeDumper)
+        timings = {}
+        for impl, (loader, dumper) in implementations.items():
+            load_time, loaded = best_of(args.repeat, lambda: yaml_codec.load(text, loader=loader))
+            dump_time, dumped = best_of(args.repeat, lambda: yaml_codec.dump(data, dumper=dumper))
+            if loaded != data or yaml_codec.load(dumped, loader=yaml.SafeLoader) != data:
+                print(f"{name:<30} {impl}: round trip does not reproduce the document")
+            timings[impl] = load_time + dump_time
+            speedup = timings['pure'] / timings[impl]
+            print(f"{name:<30} {len(text) / 1024:>6.0f}KiB {impl:<8} {load_time * 1000:>8.1f}ms "
+                  f"{dump_time * 1000:>8.1f}ms {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Check TalosKubeconfigUpdater's Kubernetes API backend against the local
+management cluster stand-in.
+
+Runs the updater against infralib.fake_kube_api.FakeKubeAPI and the KV v2
+stand-in and checks that:
+
+- a provisioned cluster's kubeconfig is extracted and stored, whether the
+  server prefers Cluster API v1beta1 or v1beta2
+- a cluster whose secret never appears (404) raises ClusterNotReadyError
+  and fails the update
+- a context that authenticates through an exec plugin makes --k8s-backend
+  native fail with UnsupportedAuthError and auto fall back to kubectl (a
+  shim on PATH that answers from the stand-in)
+- the kubeconfig file the management context is read from is left
+  byte-for-byte unchanged
+
+Exits 1 if any check fails. Run from the repository root:
+
+    python3 benchmarks/check_kube_api.py
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import textwrap
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_vault import cluster_kubeconfig, load_script
+from infralib import kube_api, yaml_codec
+from infralib.fake_kube_api import FakeKubeAPI
+from infralib.fake_vault import FakeVault
+
+CONTEXT = 'management'
+NAMESPACE = 'clusters'
+
+# Answers `kubectl --context C get secret|cluster NAME -n NS -o json` from the stand-in
+KUBECTL_SHIM = textwrap.dedent("""\
+    #!{python}
+    import json, sys, urllib.error, urllib.request
+    args = sys.argv[1:]
+    with open({log!r}, 'a') as log:
+        log.write(' '.join(args) + '\\n')
+    kind, name, namespace = args[3], args[4], args[args.index('-n') + 1]
+    prefix = {{'secret': '/api/v1', 'cluster': '/apis/{group}/{version}'}}[kind]
+    request = urllib.request.Request(f"{url}{{prefix}}/namespaces/{{namespace}}/{{kind}}s/{{name}}",
+                                     headers={{'Authorization': 'Bearer {token}'}})
+    try:
+        print(urllib.request.urlopen(request).read().decode())
+    except urllib.error.HTTPError as e:
+        sys.stderr.write(f'Error from server (NotFound): {{kind}}s "{{name}}" not found\\n')
+        sys.exit(1)
+""")
+
+
+class Checks:
+    def __init__(self):
+        self.failures = []
+
+    def expect(self, condition, description):
+        print(f"{'ok  ' if condition else 'FAIL'} {description}")
+        if not condition:
+            self.failures.append(description)
+
+
+def stored_clusters(vault, secret):
+    kubeconfig = yaml_codec.load(vault.read(secret).get('KUBECONFIG') or '{}') or {}
+    return {item['name'] for item in kubeconfig.get('clusters') or []}
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    talos = load_script('update_talos_kubeconfig', 'clusters/scripts/update_talos_kubeconfig.py')
+    checks = Checks()
+
+    with tempfile.TemporaryDirectory() as workdir, FakeVault() as vault:
+        kubeconfig_file = os.path.join(workdir, 'config')
+        os.environ['KUBECONFIG'] = kubeconfig_file
+
+        def updater(backend='native', wait_timeout=5.0):
+            return talos.TalosKubeconfigUpdater(vault.url, vault.token, CONTEXT, k8s_backend=backend,
+                                                wait_timeout=wait_timeout)
+
+        for versions in (('v1beta1',), ('v1beta2', 'v1beta1')):
+            with FakeKubeAPI(cluster_api_versions=versions) as api:
+                api.write_kubeconfig(kubeconfig_file, context=CONTEXT)
+                before = Path(kubeconfig_file).read_bytes()
+                api.add_cluster(NAMESPACE, 'cluster-0', cluster_kubeconfig(0))
+                api.add_cluster(NAMESPACE, 'cluster-1', cluster_kubeconfig(1))
+                secret = f"kubeconfigs/{versions[0]}"
+
+                clusters = [('cluster-0', NAMESPACE), ('cluster-1', NAMESPACE)]
+                outcome = updater().update_clusters_kubeconfig(clusters, f"{vault.mount}/{secret}")
+                checks.expect(outcome == talos.UPDATED and stored_clusters(vault, secret) == {'cluster-0', 'cluster-1'},
+                              f"extracts provisioned clusters served as {versions[0]}")
+
+                outcome = updater().update_clusters_kubeconfig(clusters, f"{vault.mount}/{secret}")
+                checks.expect(outcome == talos.UNCHANGED, f"reports {versions[0]} clusters already in Vault as unchanged")
+
+                missing = updater(wait_timeout=1.0)
+                try:
+                    missing.extract_cluster_kubeconfig('absent', NAMESPACE, skip_readiness_check=True)
+                    raised = False
+                except talos.ClusterNotReadyError:
+                    raised = True
+                checks.expect(raised, "raises ClusterNotReadyError when the kubeconfig secret is 404")
+                ok = updater(wait_timeout=1.0).update_cluster_kubeconfig('absent', NAMESPACE,
+                                                                         f"{vault.mount}/kubeconfigs/absent")
+                checks.expect(not ok and not vault.read('kubeconfigs/absent'),
+                              "fails the update and writes nothing for a missing cluster")
+
+                checks.expect(Path(kubeconfig_file).read_bytes() == before,
+                              f"leaves the kubeconfig file unchanged ({versions[0]})")
+
+        with FakeKubeAPI() as api:
+            config = api.kubeconfig(CONTEXT)
+            config['users'][0]['user'] = {'exec': {'apiVersion': 'client.authentication.k8s.io/v1',
+                                                   'command': 'cloud-login', 'args': ['token']}}
+            with open(kubeconfig_file, 'w') as f:
+                yaml_codec.dump(config, f)
+            before = Path(kubeconfig_file).read_bytes()
+            api.add_cluster(NAMESPACE, 'cluster-2', cluster_kubeconfig(2))
+
+            native = updater()
+            try:
+                native._get_kube_client()
+                raised = False
+            except kube_api.UnsupportedAuthError:
+                raised = True
+            checks.expect(raised, "native backend raises UnsupportedAuthError for exec credentials")
+            checks.expect(native.update_cluster_kubeconfig('cluster-2', NAMESPACE, f"{vault.mount}/kubeconfigs/native")
+                          is False, "native backend fails the update for exec credentials")
+
+            bin_dir = os.path.join(workdir, 'bin')
+            os.mkdir(bin_dir)
+            kubectl_log = os.path.join(workdir, 'kubectl.log')
+            shim = os.path.join(bin_dir, 'kubectl')
+            with open(shim, 'w') as f:
+                f.write(KUBECTL_SHIM.format(python=sys.executable, log=kubectl_log, url=api.url, token=api.token,
+                                            group=kube_api.CLUSTER_API_GROUP, version=api.cluster_api_versions[0]))
+            os.chmod(shim, 0o755)
+            os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+
+            auto = updater(backend='auto')
+            ok = auto.update_cluster_kubeconfig('cluster-2', NAMESPACE, f"{vault.mount}/kubeconfigs/auto")
+            with open(kubectl_log) as f:
+                calls = f.read().splitlines()
+            checks.expect(ok and auto.k8s_backend == 'kubectl' and stored_clusters(vault, 'kubeconfigs/auto') == {'cluster-2'},
+                          "auto backend falls back to kubectl for exec credentials")
+            checks.expect(bool(calls) and all(call.startswith(f"--context {CONTEXT} get ") for call in calls),
+                          "kubectl is called with --context instead of switching contexts")
+            checks.expect(Path(kubeconfig_file).read_bytes() == before,
+                          "leaves the kubeconfig file unchanged (exec credentials)")
+
+    print(f"{len(checks.failures)} checks failed" if checks.failures else "all checks passed")
+    sys.exit(1 if checks.failures else 0)
+
+
+if __name__ == "__main__":
+    main()
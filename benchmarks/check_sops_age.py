@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Check in-process SOPS decryption (infralib.sops_age) against the sops binary.
+
+Decrypts every fixture in benchmarks/fixtures/sops with SopsDecryptor and
+compares the result with `sops --decrypt --output-type json` of the same
+file or, when sops is not installed, with that output as recorded next to
+the fixture (<fixture>.decrypted.json) when it was generated. Also checks
+that a modified value fails MAC verification. Exits 1 if any check fails.
+Run from the repository root:
+
+    python3 benchmarks/check_sops_age.py
+
+--regenerate encrypts the fixtures again from plain/ with the sops on PATH
+and records its output. The .sops.yaml there encrypts them to the test-only
+key in age-key.txt.
+"""
+
+import argparse
+import copy
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from infralib import sops_age
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures' / 'sops'
+KEY_FILE = FIXTURES_DIR / 'age-key.txt'
+
+# fixture: (plaintext in plain/, sops --encrypt options)
+FIXTURES = {
+    'basic.yaml': ('basic.yaml', ['--unencrypted-suffix', '_unencrypted']),
+    'mac-only.yaml': ('basic.yaml', ['--unencrypted-suffix', '_unencrypted', '--mac-only-encrypted']),
+    'encrypted-regex.yaml': ('basic.yaml', ['--encrypted-regex', '^(string|password_unencrypted|list|deeper)$']),
+    'comments.yaml': ('comments.yaml', []),
+    'basic.json': ('basic.json', []),
+}
+
+
+def sops(*args):
+    env = dict(os.environ, SOPS_AGE_KEY_FILE=str(KEY_FILE))
+    return subprocess.run(['sops', *args], capture_output=True, text=True, check=True,
+                          cwd=FIXTURES_DIR, env=env).stdout
+
+
+def sops_decrypt(fixture):
+    return json.loads(sops('--decrypt', '--output-type', 'json', fixture))
+
+
+def regenerate():
+    for fixture, (source, options) in FIXTURES.items():
+        encrypted = sops('--encrypt', *options, str(Path('plain') / source))
+        (FIXTURES_DIR / fixture).write_text(encrypted)
+        expected = sops_decrypt(fixture)
+        (FIXTURES_DIR / f"{fixture}.decrypted.json").write_text(json.dumps(expected, indent=2) + '\n')
+        print(f"Encrypted plain/{source} -> {fixture}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare in-process SOPS decryption with sops --decrypt')
+    parser.add_argument('--regenerate', action='store_true',
+                       help='Encrypt the fixtures again with the sops on PATH before checking')
+    args = parser.parse_args()
+
+    if not sops_age.CRYPTOGRAPHY_AVAILABLE:
+        print("Missing required dependency: cryptography")
+        print("Install with: pip install cryptography")
+        sys.exit(1)
+
+    have_sops = shutil.which('sops') is not None
+    if args.regenerate:
+        if not have_sops:
+            print("Error: --regenerate needs sops on PATH")
+            sys.exit(1)
+        regenerate()
+    if have_sops:
+        print(f"Comparing with {sops('--version', '--disable-version-check').splitlines()[0]}")
+    else:
+        print("sops not found - comparing with its recorded output")
+
+    decryptor = sops_age.SopsDecryptor(sops_age.parse_identities(KEY_FILE.read_text()))
+    failures = []
+
+    for fixture in FIXTURES:
+        if have_sops:
+            expected = sops_decrypt(fixture)
+        else:
+            expected = json.loads((FIXTURES_DIR / f"{fixture}.decrypted.json").read_text())
+        try:
+            # Numbers compare by value, so 2 from sops matches 2.0 decrypted here
+            ok = decryptor.decrypt_file(str(FIXTURES_DIR / fixture)) == expected
+            detail = '' if ok else ' (output differs)'
+        except sops_age.SopsDecryptError as e:
+            ok, detail = False, f" ({type(e).__name__}: {e})"
+        print(f"{'ok  ' if ok else 'FAIL'} {fixture}{detail}")
+        if not ok:
+            failures.append(fixture)
+
+    document = sops_age.load_document(str(FIXTURES_DIR / 'basic.yaml'))
+    tampered = copy.deepcopy(document)
+    tampered['password_unencrypted'] = 'changed'
+    try:
+        decryptor.decrypt_document(tampered)
+        rejected = False
+    except sops_age.SopsDecryptError as e:
+        rejected = 'MAC mismatch' in str(e)
+    print(f"{'ok  ' if rejected else 'FAIL'} basic.yaml with a modified cleartext value fails the MAC check")
+    if not rejected:
+        failures.append('tampered basic.yaml')
+
+    print(f"{len(failures)} checks failed" if failures else "all checks passed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Stress the kubeconfig updaters' check-and-set writes against the local KV
+v2 stand-in.
+
+Starts --updaters concurrent updaters, alternating TalosKubeconfigUpdater
+and the init KubeconfigUpdater, each merging its own cluster into the same
+kubeconfig secret at the same moment. Every cluster must be in the final
+kubeconfig and the secret's other keys must survive; exits 1 otherwise.
+Run from the repository root:
+
+    python3 benchmarks/stress_kubeconfig_cas.py --updaters 50 --latency 0.002
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_vault import cluster_kubeconfig, load_script
+from infralib import yaml_codec
+from infralib.fake_vault import FakeVault
+
+SECRET = 'cluster-secret-store/secrets'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run concurrent kubeconfig updaters against one Vault secret')
+    parser.add_argument('--updaters', type=int, default=50,
+                       help='Updaters started at once, one cluster each (default: 50)')
+    parser.add_argument('--latency', type=float, default=0.002,
+                       help='Seconds the stand-in adds to every request (default: 0.002)')
+    args = parser.parse_args()
+
+    # Conflicts are logged at WARNING; only the summary matters here
+    logging.disable(logging.WARNING)
+
+    talos = load_script('update_talos_kubeconfig', 'clusters/scripts/update_talos_kubeconfig.py')
+    init = load_script('update_kubeconfig', 'init/scripts/update_kubeconfig.py')
+
+    with FakeVault(latency=args.latency) as vault, tempfile.TemporaryDirectory() as workdir:
+        vault.seed({SECRET: {'OTHER_KEY': 'kept'}})
+        vault_path = f"{vault.mount}/{SECRET}"
+        names = [f"cluster-{index}" for index in range(args.updaters)]
+        start = threading.Barrier(args.updaters)
+        results = {}
+
+        def run(index):
+            name = names[index]
+            kubeconfig = cluster_kubeconfig(index)
+            if index % 2:
+                updater = init.KubeconfigUpdater(vault.url, vault.token)
+                kubeconfig_file = os.path.join(workdir, f"{name}.yaml")
+                with open(kubeconfig_file, 'w') as f:
+                    f.write(kubeconfig)
+                updater._get_vault_client()
+                start.wait()
+                results[name] = updater.update_kubeconfig(kubeconfig_file, vault_path, name, name)
+            else:
+                updater = talos.TalosKubeconfigUpdater(vault.url, vault.token, management_context='stress')
+                updater._get_vault_client()
+                start.wait()
+                outcome = updater.publish_kubeconfig(
+                    vault_path, 'KUBECONFIG',
+                    lambda existing: updater.merge_kubeconfigs(existing, {name: kubeconfig}))
+                results[name] = outcome != talos.FAILED
+
+        began = time.perf_counter()
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(args.updaters)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        stored = vault.read(SECRET)
+        kubeconfig = yaml_codec.load(stored['KUBECONFIG'])
+        missing = {section: sorted(set(names) - {item['name'] for item in kubeconfig.get(section) or []})
+                   for section in ('clusters', 'contexts', 'users')}
+        failed = sorted(name for name, ok in results.items() if not ok)
+
+        print(f"{args.updaters} updaters in {elapsed:.2f}s: {vault.stats['write']} writes, "
+              f"{vault.stats['cas_conflicts']} CAS conflicts, {len(failed)} failed")
+        ok = not failed and not any(missing.values()) and stored.get('OTHER_KEY') == 'kept'
+        for section, lost in missing.items():
+            if lost:
+                print(f"lost {section}: {', '.join(lost)}")
+        if failed:
+            print(f"failed updaters: {', '.join(failed)}")
+        if stored.get('OTHER_KEY') != 'kept':
+            print("OTHER_KEY was not preserved")
+        print("no entries lost" if ok else "entries lost")
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,18 +5,20 @@ OPERATION="$1"
 CLUSTER_NAME="$2"
 KUBECONFIG_FILE="$3"
 VAULT_PATH="${VAULT_PATH:-kv/cluster-secret-store/secrets}"
+REPO_ROOT="$(cd "$(dirname "${BASH_SOURCE[0]}")/../.." && pwd)"
 
 if [ -z "$OPERATION" ] || [ -z "$CLUSTER_NAME" ]; then
   echo "Usage: $0 <add|remove|get> <cluster-name> [kubeconfig-file]"
   exit 1
 fi
 
+# LibYAML-backed conversions shared with the Python scripts (infralib/yaml_codec.py)
 yaml_to_json() {
-  python3 -c 'import sys, yaml, json; json.dump(yaml.safe_load(sys.stdin), sys.stdout)'
+  PYTHONPATH="$REPO_ROOT${PYTHONPATH:+:$PYTHONPATH}" python3 -m infralib.yaml_codec to-json
 }
 
 json_to_yaml() {
-  python3 -c 'import sys, yaml, json; yaml.dump(json.load(sys.stdin), sys.stdout, default_flow_style=False, sort_keys=False)'
+  PYTHONPATH="$REPO_ROOT${PYTHONPATH:+:$PYTHONPATH}" python3 -m infralib.yaml_codec to-yaml
 }
 
 merge_kubeconfig() {
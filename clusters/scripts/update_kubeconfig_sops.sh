@@ -26,12 +26,13 @@ if [ ! -f "$SOPS_CONFIG" ]; then
   exit 1
 fi
 
+# LibYAML-backed conversions shared with the Python scripts (infralib/yaml_codec.py)
 yaml_to_json() {
-  python3 -c 'import sys, yaml, json; json.dump(yaml.safe_load(sys.stdin), sys.stdout)'
+  PYTHONPATH="$SCRIPT_DIR${PYTHONPATH:+:$PYTHONPATH}" python3 -m infralib.yaml_codec to-json
 }
 
 json_to_yaml() {
-  python3 -c 'import sys, yaml, json; yaml.dump(json.load(sys.stdin), sys.stdout, default_flow_style=False, sort_keys=False)'
+  PYTHONPATH="$SCRIPT_DIR${PYTHONPATH:+:$PYTHONPATH}" python3 -m infralib.yaml_codec to-yaml
 }
 
 merge_kubeconfig() {
@@ -8,20 +8,50 @@ import sys
 import os
 import logging
 import argparse
+import asyncio
 import subprocess
 import base64
+import hashlib
+import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
 try:
-    import yaml
     import hvac
+    import requests
+    from infralib import kube_api, kube_wait, vault_kv, yaml_codec
+    from infralib.vault_scheduler import vault_client
 except ImportError as e:
     print(f"Missing required dependency: {e}")
-    print("Install with: pip install pyyaml hvac")
+    print("Install with: pip install pyyaml hvac requests")
     sys.exit(1)
 
 
+# Outcome of publishing to Vault, and the exit status main() reports for it
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+EXIT_STATUS = {UPDATED: 0, FAILED: 1, UNCHANGED: 3}
+
+
+def kubeconfig_digest(kubeconfig: str) -> str:
+    """
+    SHA-256 of what a kubeconfig means rather than how it is written:
+    mapping keys and the clusters, contexts and users lists are sorted, and
+    current-context is left out since every merge moves it
+    """
+    config = dict(yaml_codec.load(kubeconfig) or {})
+    config.pop('current-context', None)
+    for section in ('clusters', 'contexts', 'users'):
+        if isinstance(config.get(section), list):
+            config[section] = sorted(config[section], key=lambda item: str((item or {}).get('name')))
+    canonical = json.dumps(config, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
 class ClusterNotReadyError(Exception):
     """Raised when cluster is not in Provisioned state"""
     pass
@@ -35,12 +65,17 @@ class KubectlConnectionError(Exception):
 class TalosKubeconfigUpdater:
     """Cluster API Talos kubeconfig updater for Vault"""
 
-    def __init__(self, vault_addr: str, vault_token: str, management_context: str, dry_run: bool = False):
+    def __init__(self, vault_addr: str, vault_token: str, management_context: str, dry_run: bool = False,
+                 k8s_backend: str = 'auto', wait_timeout: float = 90.0, max_parallel: int = 16):
         self.vault_addr = vault_addr
         self.vault_token = vault_token
         self.management_context = management_context
         self.dry_run = dry_run
+        self.k8s_backend = k8s_backend
+        self.wait_timeout = wait_timeout
+        self.max_parallel = max_parallel
         self.client = None
+        self.kube_client = None
         self._setup_logging()
 
     def _setup_logging(self):
@@ -57,7 +92,8 @@ class TalosKubeconfigUpdater:
             return self.client
 
         try:
-            self.client = hvac.Client(url=self.vault_addr, token=self.vault_token)
+            # Requests are rate limited and retried on 429/5xx by the shared scheduler
+            self.client = vault_client(self.vault_addr, self.vault_token)
             if not self.client.is_authenticated():
                 raise Exception("Failed to authenticate to Vault")
             self.logger.info("Successfully authenticated to Vault")
@@ -66,134 +102,134 @@ class TalosKubeconfigUpdater:
             self.logger.error(f"Vault connection failed: {e}")
             raise
 
-    def extract_kubeconfig_from_secret(self, cluster_name: str, namespace: str = "clusters") -> str:
+    def _get_kube_client(self):
         """
-        Extract kubeconfig from Cluster API secret using kubectl
-
-        Secret naming: <cluster-name>-kubeconfig
-        Data field: .data.value (base64 encoded)
+        Kubernetes API client for the management context, or None when
+        kubectl is used instead (--k8s-backend kubectl, or auto with
+        credentials only kubectl can produce)
         """
-        secret_name = f"{cluster_name}-kubeconfig"
+        if self.kube_client or self.k8s_backend == 'kubectl':
+            return self.kube_client
 
         try:
-            # Verify context exists first
-            self.logger.info(f"Using management cluster context: {self.management_context}")
-            check_context = subprocess.run(
-                ["kubectl", "config", "get-contexts", "-o", "name"],
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            available_contexts = check_context.stdout.strip().split('\n')
-
-            if self.management_context not in available_contexts:
-                raise ValueError(f"Context '{self.management_context}' not found in kubeconfig. Available contexts: {', '.join(available_contexts)}")
-
-            # Set context to management cluster
-            subprocess.run(
-                ["kubectl", "config", "use-context", self.management_context],
-                check=True,
-                capture_output=True,
-                text=True
-            )
-
-            self.logger.info(f"Extracting kubeconfig from secret: {secret_name} in namespace: {namespace}")
-
-            # Extract secret using kubectl
+            # One pooled connection per cluster waited on at once
+            self.kube_client = kube_api.KubeClient.from_context(self.management_context,
+                                                                pool_size=self.max_parallel)
+            self.logger.info(f"Using the Kubernetes API of context: {self.management_context}")
+        except kube_api.UnsupportedAuthError as e:
+            if self.k8s_backend == 'native':
+                raise
+            self.logger.info(f"{e} - using kubectl")
+            self.k8s_backend = 'kubectl'
+        return self.kube_client
+
+    def close(self):
+        """Release the management cluster connection"""
+        if self.kube_client:
+            self.kube_client.close()
+            self.kube_client = None
+
+    # kubectl resource names of the kinds read from the management cluster
+    KUBECTL_KINDS = {'secrets': 'secret', 'clusters': 'cluster'}
+
+    def _fetch(self, kind: str, namespace: str, name: str):
+        """One object from the management cluster, or None when it does not exist"""
+        kube_client = self._get_kube_client()
+        try:
+            if kube_client:
+                return kube_client.get(kube_client.resource_path(kind, namespace, name))
+            # --context leaves the kubeconfig's current-context alone
             result = subprocess.run(
                 [
-                    "kubectl", "get", "secret", secret_name,
+                    "kubectl", "--context", self.management_context,
+                    "get", self.KUBECTL_KINDS[kind], name,
                     "-n", namespace,
-                    "-o", "jsonpath={.data.value}"
+                    "-o", "json"
                 ],
                 check=True,
                 capture_output=True,
                 text=True
             )
+            return json.loads(result.stdout)
 
-            # Decode base64
-            kubeconfig_b64 = result.stdout.strip()
-            if not kubeconfig_b64:
-                raise ValueError(f"Secret {secret_name} exists but has no data")
-
-            kubeconfig = base64.b64decode(kubeconfig_b64).decode('utf-8')
-            self.logger.info(f"Successfully extracted kubeconfig for {cluster_name}")
-
-            return kubeconfig
-
+        except kube_api.KubeAPIError as e:
+            if e.status == 404:
+                return None
+            self.logger.error(f"Kubernetes API request failed: {e}")
+            raise
+        except requests.exceptions.ConnectionError as e:
+            self.logger.error(f"Cannot connect to management cluster: {e}")
+            raise KubectlConnectionError("Cannot connect to management cluster")
         except subprocess.CalledProcessError as e:
             stderr = e.stderr if e.stderr else ""
             if "NotFound" in stderr or "not found" in stderr:
-                self.logger.error(f"Secret {secret_name} not found in namespace {namespace}")
-                self.logger.info("Cluster may not be ready yet. Please wait for cluster provisioning to complete.")
-                raise ClusterNotReadyError(f"Cluster {cluster_name} secret not found")
+                return None
             elif "connection refused" in stderr or "Unable to connect" in stderr:
                 self.logger.error(f"Cannot connect to management cluster: {stderr}")
                 raise KubectlConnectionError("Cannot connect to management cluster")
             else:
                 self.logger.error(f"kubectl command failed: {stderr}")
                 raise
-        except Exception as e:
-            self.logger.error(f"Error extracting kubeconfig: {e}")
-            raise
 
-    def check_cluster_ready(self, cluster_name: str, namespace: str = "clusters") -> bool:
+    def wait_for(self, kind: str, namespace: str, name: str, predicate, deadline: float):
         """
-        Check if Cluster API cluster is ready by checking the Cluster resource
+        Wait until predicate(object) holds or the time.monotonic() deadline
+        passes; returns the last object seen (None if it does not exist).
+        Follows the object through the watch API when reading natively,
+        otherwise polls with backoff.
         """
+        kube_client = self._get_kube_client()
+        if not kube_client:
+            return kube_wait.poll_until(lambda: self._fetch(kind, namespace, name), predicate, deadline)
         try:
-            result = subprocess.run(
-                [
-                    "kubectl", "get", "cluster", cluster_name,
-                    "-n", namespace,
-                    "-o", "jsonpath={.status.phase}"
-                ],
-                check=True,
-                capture_output=True,
-                text=True
-            )
+            return kube_wait.watch_until(kube_client, kind, namespace, name, predicate, deadline, self.logger)
+        except requests.exceptions.ConnectionError as e:
+            self.logger.error(f"Cannot connect to management cluster: {e}")
+            raise KubectlConnectionError("Cannot connect to management cluster")
 
-            phase = result.stdout.strip()
-            self.logger.info(f"Cluster {cluster_name} phase: {phase}")
+    @staticmethod
+    def _secret_value(secret) -> str:
+        return ((secret or {}).get('data') or {}).get('value', '').strip()
 
-            return phase == "Provisioned"
+    @staticmethod
+    def _cluster_phase(cluster) -> str:
+        return ((cluster or {}).get('status') or {}).get('phase', '')
 
-        except subprocess.CalledProcessError:
-            self.logger.warning(f"Could not check cluster status for {cluster_name}")
-            return False
+    def _get_kv_store(self) -> vault_kv.KVStore:
+        """Cached KV v2 access through the Vault client"""
+        return vault_kv.store(self._get_vault_client())
 
-    def get_vault_secret(self, vault_path: str, key: str = "KUBECONFIG") -> str:
-        """Get existing kubeconfig from Vault"""
-        if self.dry_run:
-            self.logger.info(f"[DRY RUN] Would read secret from {vault_path}")
-            return None
-
-        client = self._get_vault_client()
-
-        # Parse vault path (mount_point/secret_path)
-        if '/' not in vault_path:
-            raise ValueError(f"Invalid vault path format: {vault_path}. Expected: mount_point/secret_path")
-
-        mount_point, secret_path = vault_path.split('/', 1)
+    def read_vault_secret(self, vault_path: str) -> dict:
+        """
+        Read every key of the secret at vault_path; {} when it does not exist
+        yet. Repeated reads, and the first attempt of publish_kubeconfig(),
+        are served from the process-wide cache until the secret is written.
+        """
+        mount_point, secret_path = vault_kv.split_path(vault_path)
 
         try:
             self.logger.info(f"Reading secret from {vault_path}")
-            secret = client.secrets.kv.v2.read_secret_version(
-                path=secret_path,
-                mount_point=mount_point
-            )
-
-            if secret and 'data' in secret and 'data' in secret['data']:
-                kubeconfig = secret['data']['data'].get(key)
-                if kubeconfig:
-                    self.logger.info("Found existing kubeconfig in Vault")
-                    return kubeconfig
+            data, version = self._get_kv_store().read(secret_path, mount_point)
+        except Exception as e:
+            # Treating a failed read as "no existing secret" would overwrite
+            # the stored kubeconfig and drop every other cluster from it
+            self.logger.error(f"Error reading from Vault: {e}")
+            raise
 
-        except hvac.exceptions.InvalidPath:
+        if not version:
             self.logger.info("No existing secret found - will create new one")
-        except Exception as e:
-            self.logger.warning(f"Error reading from Vault: {e}")
+        return data
+
+    def get_vault_secret(self, vault_path: str, key: str = "KUBECONFIG") -> str:
+        """Get existing kubeconfig from Vault"""
+        if self.dry_run:
+            self.logger.info(f"[DRY RUN] Would read secret from {vault_path}")
+            return None
 
+        kubeconfig = self.read_vault_secret(vault_path).get(key)
+        if kubeconfig:
+            self.logger.info("Found existing kubeconfig in Vault")
+            return kubeconfig
         return None
 
     def merge_kubeconfig(self, existing: str, new: str, cluster_name: str) -> str:
@@ -205,42 +241,51 @@ class TalosKubeconfigUpdater:
         - Cluster name = cluster name
         - User name = cluster name
         """
-        if not existing:
-            self.logger.info("No existing config - using new config")
-            # Still need to update naming in new config
-            return self._update_kubeconfig_names(new, cluster_name)
+        return self.merge_kubeconfigs(existing, {cluster_name: new})
 
+    def merge_kubeconfigs(self, existing: str, new_configs: dict) -> str:
+        """
+        Merge several clusters ({cluster_name: kubeconfig}) into existing
+        kubeconfig, parsing and emitting it only once. current-context ends
+        up on the last cluster, as if each had been merged in turn.
+        """
         try:
-            existing_yaml = yaml.safe_load(existing)
-            new_yaml = yaml.safe_load(new)
+            merged = yaml_codec.load(existing) if existing else None
+            if not merged:
+                self.logger.info("No existing config - using new config")
 
-            # Update names in new config
-            new_yaml = self._update_kubeconfig_names_yaml(new_yaml, cluster_name)
+            for cluster_name, new in new_configs.items():
+                # Update names in new config
+                new_yaml = self._update_kubeconfig_names_yaml(yaml_codec.load(new), cluster_name)
+                if not merged:
+                    merged = new_yaml
+                    continue
 
-            # Merge sections
-            for section in ['clusters', 'contexts', 'users']:
-                if section not in existing_yaml:
-                    existing_yaml[section] = []
+                # Merge sections
+                for section in ['clusters', 'contexts', 'users']:
+                    if section not in merged:
+                        merged[section] = []
 
-                # Remove existing entries for this cluster
-                existing_yaml[section] = [
-                    item for item in existing_yaml[section]
-                    if item.get('name') != cluster_name
-                ]
+                    # Remove existing entries for this cluster
+                    merged[section] = [
+                        item for item in merged[section]
+                        if item.get('name') != cluster_name
+                    ]
 
-                # Add new entries
-                if section in new_yaml and new_yaml[section]:
-                    existing_yaml[section].extend(new_yaml[section])
+                    # Add new entries
+                    if section in new_yaml and new_yaml[section]:
+                        merged[section].extend(new_yaml[section])
 
-            # Ensure required fields
-            existing_yaml.setdefault('apiVersion', 'v1')
-            existing_yaml.setdefault('kind', 'Config')
+                # Ensure required fields
+                merged.setdefault('apiVersion', 'v1')
+                merged.setdefault('kind', 'Config')
 
-            # Set current-context to the newly added cluster
-            existing_yaml['current-context'] = cluster_name
+                # Set current-context to the newly added cluster
+                merged['current-context'] = cluster_name
 
-            self.logger.info(f"Successfully merged config for cluster: {cluster_name}")
-            return yaml.dump(existing_yaml, default_flow_style=False)
+                self.logger.info(f"Successfully merged config for cluster: {cluster_name}")
+
+            return yaml_codec.dump(merged)
 
         except Exception as e:
             self.logger.error(f"Error merging configs: {e}")
@@ -271,103 +316,187 @@ class TalosKubeconfigUpdater:
 
         return kubeconfig_yaml
 
-    def _update_kubeconfig_names(self, kubeconfig_str: str, cluster_name: str) -> str:
-        """Update all names in kubeconfig string to use cluster name"""
-        kubeconfig_yaml = yaml.safe_load(kubeconfig_str)
-        updated_yaml = self._update_kubeconfig_names_yaml(kubeconfig_yaml, cluster_name)
-        return yaml.dump(updated_yaml, default_flow_style=False)
-
-    def update_vault_secret(self, vault_path: str, kubeconfig: str, key: str = "KUBECONFIG") -> bool:
-        """Update kubeconfig in Vault secret"""
+    def publish_kubeconfig(self, vault_path: str, key: str, build) -> str:
+        """
+        Store build(existing kubeconfig or None) under key in the Vault
+        secret, keeping its other keys. Starts from the cached read of the
+        secret when there is one. The write is pinned to the version read;
+        when another updater wrote in between, the secret is read again and
+        build() re-applied to it. Nothing is written when the result has the
+        same kubeconfig_digest() as the stored kubeconfig, so unchanged runs
+        do not pile up KV versions. Returns UPDATED, UNCHANGED or FAILED.
+        """
         if self.dry_run:
+            self.logger.info(f"[DRY RUN] Would read secret from {vault_path}")
+            kubeconfig = build(None)
             self.logger.info(f"[DRY RUN] Would update Vault at {vault_path}")
             self.logger.info(f"[DRY RUN] Kubeconfig preview (first 200 chars):\n{kubeconfig[:200]}...")
-            return True
+            return UPDATED
 
-        client = self._get_vault_client()
+        def apply(data):
+            existing = data.get(key)
+            kubeconfig = build(existing)
+            if existing and kubeconfig_digest(existing) == kubeconfig_digest(kubeconfig):
+                return None
+            return {**data, key: kubeconfig}
+
+        try:
+            mount_point, secret_path = vault_kv.split_path(vault_path)
+            written = self._get_kv_store().update(secret_path, apply, mount_point, logger=self.logger)
+            if written is None:
+                self.logger.info(f"Kubeconfig at {vault_path} is unchanged - not writing a new version")
+                return UNCHANGED
+            self.logger.info(f"Successfully updated secret at {vault_path}")
+            return UPDATED
+
+        except Exception as e:
+            self.logger.error(f"Failed to update Vault secret: {e}")
+            return FAILED
 
-        # Parse vault path
-        mount_point, secret_path = vault_path.split('/', 1)
+    def update_vault_secret(self, vault_path: str, kubeconfig: str, key: str = "KUBECONFIG") -> bool:
+        """Update kubeconfig in Vault secret, keeping its other keys"""
+        return self.publish_kubeconfig(vault_path, key, lambda existing: kubeconfig) != FAILED
 
+    def extract_cluster_kubeconfig(self, cluster_name: str, namespace: str,
+                                   skip_readiness_check: bool = False) -> str:
+        """
+        Extract one cluster's kubeconfig as soon as its secret has data,
+        waiting up to wait_timeout seconds for the cluster to be provisioned
+        and the secret to appear
+        """
+        deadline = time.monotonic() + self.wait_timeout
+
+        # Wait for the cluster to be ready (optional)
+        if not skip_readiness_check:
+            self.logger.info(f"Waiting up to {self.wait_timeout:g}s for cluster {cluster_name} to be provisioned")
+            cluster = self.wait_for('clusters', namespace, cluster_name,
+                                    lambda obj: self._cluster_phase(obj) == "Provisioned", deadline)
+            phase = self._cluster_phase(cluster)
+            self.logger.info(f"Cluster {cluster_name} phase: {phase or 'unknown'}")
+            if phase != "Provisioned":
+                self.logger.warning(f"Cluster {cluster_name} is not ready yet")
+                self.logger.info("Attempting to extract kubeconfig anyway...")
+
+        # Extract kubeconfig from the Cluster API secret once it has data
+        secret_name = f"{cluster_name}-kubeconfig"
+        self.logger.info(f"Extracting kubeconfig from secret: {secret_name} in namespace: {namespace}")
+        secret = self.wait_for('secrets', namespace, secret_name, self._secret_value, deadline)
+        if secret is None:
+            self.logger.error(f"Secret {secret_name} not found in namespace {namespace} "
+                              f"after {self.wait_timeout:g}s")
+            raise ClusterNotReadyError(f"Cluster {cluster_name} secret not found")
+        if not self._secret_value(secret):
+            raise ClusterNotReadyError(f"Secret {secret_name} exists but has no data")
+
+        kubeconfig = base64.b64decode(self._secret_value(secret)).decode('utf-8')
+        self.logger.info(f"Successfully extracted kubeconfig for {cluster_name}")
+        return kubeconfig
+
+    async def extract_clusters_kubeconfig(self, clusters: list, skip_readiness_check: bool = False):
+        """
+        Wait on every (cluster_name, namespace) in clusters at once, up to
+        max_parallel at a time, and extract each kubeconfig as soon as that
+        cluster is ready. Returns ({cluster_name: kubeconfig}, [failed cluster
+        names]), both in the order of clusters.
+        """
+        new_configs = {}
+        failed = []
         try:
-            # Get existing secret data to preserve other keys
-            secret_data = {key: kubeconfig}
+            # Choose the backend before the waits share it
+            self._get_kube_client()
+        except Exception as e:
+            self.logger.error(f"Cannot read management context {self.management_context}: {e}")
+            return new_configs, [cluster_name for cluster_name, _ in clusters]
+
+        loop = asyncio.get_running_loop()
 
+        async def extract(cluster_name, namespace):
             try:
-                existing = client.secrets.kv.v2.read_secret_version(
-                    path=secret_path,
-                    mount_point=mount_point
-                )
-                if existing and 'data' in existing and 'data' in existing['data']:
-                    existing_data = existing['data']['data']
-                    existing_data.update(secret_data)
-                    secret_data = existing_data
-            except hvac.exceptions.InvalidPath:
-                pass  # Secret doesn't exist, use new data
-
-            # Write secret
-            client.secrets.kv.v2.create_or_update_secret(
-                path=secret_path,
-                secret=secret_data,
-                mount_point=mount_point
-            )
+                return cluster_name, await loop.run_in_executor(
+                    executor, self.extract_cluster_kubeconfig, cluster_name, namespace, skip_readiness_check)
+            except Exception as e:
+                self.logger.error(f"Update failed for {cluster_name}: {e}")
+                return cluster_name, None
+
+        # The waits block on the API server or kubectl, so each runs in a
+        # worker thread; the pool size caps how many run at once
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_parallel, len(clusters)))) as executor:
+            results = dict(await asyncio.gather(*[extract(*cluster) for cluster in clusters]))
+
+        # In the order given, not the order they finished, so the merge (and
+        # the current-context it leaves) is the same on every run
+        for cluster_name, _ in clusters:
+            if results[cluster_name] is None:
+                failed.append(cluster_name)
+            else:
+                new_configs[cluster_name] = results[cluster_name]
+        return new_configs, failed
 
-            self.logger.info(f"Successfully updated secret at {vault_path}")
-            return True
+    def update_clusters_kubeconfig(self, clusters: list, vault_path: str, vault_key: str = "KUBECONFIG",
+                                   skip_readiness_check: bool = False) -> str:
+        """
+        Extract the kubeconfig of every (cluster_name, namespace) in clusters,
+        waiting on all of them concurrently, and store them all with one Vault
+        read and one check-and-set write (repeated if another updater wrote
+        the secret in between). Returns UPDATED, or UNCHANGED when Vault
+        already held an equivalent kubeconfig. Clusters that fail to extract
+        are left as they are in Vault and make this return FAILED.
+        """
+        new_configs, failed = asyncio.run(self.extract_clusters_kubeconfig(clusters, skip_readiness_check))
 
-        except Exception as e:
-            self.logger.error(f"Failed to update Vault secret: {e}")
-            return False
+        if not new_configs:
+            return FAILED
+
+        # Merge configs into whatever version of the secret is current when writing
+        outcome = self.publish_kubeconfig(vault_path, vault_key,
+                                          lambda existing: self.merge_kubeconfigs(existing, new_configs))
+        if outcome == FAILED:
+            self.logger.error(f"Update failed for {', '.join(new_configs)}")
+            return FAILED
+
+        if failed:
+            self.logger.error(f"Kubeconfig not updated for: {', '.join(failed)}")
+            return FAILED
+        return outcome
 
     def update_cluster_kubeconfig(self, cluster_name: str, namespace: str,
                                    vault_path: str, vault_key: str = "KUBECONFIG",
                                    skip_readiness_check: bool = False) -> bool:
         """Main method to extract and update kubeconfig for a single cluster"""
-        try:
-            # Check if cluster is ready (optional)
-            if not skip_readiness_check:
-                if not self.check_cluster_ready(cluster_name, namespace):
-                    self.logger.warning(f"Cluster {cluster_name} is not ready yet")
-                    self.logger.info("Attempting to extract kubeconfig anyway...")
-
-            # Extract kubeconfig from Cluster API secret with retry
-            new_config = None
-            for attempt in range(3):
-                try:
-                    new_config = self.extract_kubeconfig_from_secret(cluster_name, namespace)
-                    break
-                except ClusterNotReadyError:
-                    if attempt < 2:
-                        self.logger.info(f"Retry {attempt + 1}/3 in 30 seconds...")
-                        time.sleep(30)
-                    else:
-                        raise
-
-            if not new_config:
-                raise Exception("Failed to extract kubeconfig after retries")
-
-            # Get existing config from Vault
-            existing_config = self.get_vault_secret(vault_path, vault_key)
-
-            # Merge configs
-            merged_config = self.merge_kubeconfig(existing_config, new_config, cluster_name)
-
-            # Update Vault
-            return self.update_vault_secret(vault_path, merged_config, vault_key)
-
-        except Exception as e:
-            self.logger.error(f"Update failed for {cluster_name}: {e}")
-            return False
+        return self.update_clusters_kubeconfig([(cluster_name, namespace)], vault_path, vault_key,
+                                               skip_readiness_check) != FAILED
+
+
+def tofu_cluster_names(tofu_dir: str = ".") -> list:
+    """Cluster names from `tofu output -json proxmox_cluster_names` in the selected workspace"""
+    result = subprocess.run(
+        ["tofu", "output", "-json", "proxmox_cluster_names"],
+        cwd=tofu_dir,
+        check=True,
+        capture_output=True,
+        text=True
+    )
+    return json.loads(result.stdout) or []
 
 
 def main():
     parser = argparse.ArgumentParser(
-        description='Extract Talos/Cluster API kubeconfig and update Vault'
+        description='Extract Talos/Cluster API kubeconfig and update Vault',
+        epilog='Exit status: 0 when Vault was updated, 3 when it already held an equivalent kubeconfig '
+               '(nothing written), 1 on failure'
     )
-    parser.add_argument('--cluster-name', required=True,
+    targets = parser.add_mutually_exclusive_group(required=True)
+    targets.add_argument('--cluster-name',
                        help='Name of the Cluster API cluster')
+    targets.add_argument('--clusters', nargs='+', metavar='NAME',
+                       help='Update several clusters with a single Vault read and write')
+    targets.add_argument('--from-tofu-output', action='store_true',
+                       help='Update every cluster in `tofu output -json proxmox_cluster_names`')
+    parser.add_argument('--tofu-dir', default='.',
+                       help='OpenTofu stack directory for --from-tofu-output (default: current directory)')
     parser.add_argument('--namespace', default='clusters',
-                       help='Namespace where cluster is deployed (default: clusters)')
+                       help="Namespace where clusters are deployed; '{cluster}' is replaced by each cluster name "
+                            "(default: clusters)")
     parser.add_argument('--vault-path', required=True,
                        help='Vault secret path (format: mount_point/secret_path)')
     parser.add_argument('--vault-addr', required=True,
@@ -376,8 +505,16 @@ def main():
                        help='Key name in vault secret (default: KUBECONFIG)')
     parser.add_argument('--management-context', required=True,
                        help='Kubectl context for management cluster')
+    parser.add_argument('--k8s-backend', choices=['auto', 'native', 'kubectl'], default='auto',
+                       help='Read the management cluster through its API (native), with kubectl (kubectl), or '
+                            'natively unless the context authenticates through an exec plugin (auto)')
+    parser.add_argument('--max-parallel', type=int, default=16,
+                       help='Clusters waited on at the same time (default: 16)')
     parser.add_argument('--skip-readiness-check', action='store_true',
                        help='Skip cluster readiness check')
+    parser.add_argument('--wait-timeout', type=float, default=90,
+                       help='Seconds to wait for each cluster to be provisioned and its kubeconfig secret '
+                            'to appear (default: 90)')
     parser.add_argument('--dry-run', action='store_true',
                        help='Simulate without updating Vault')
     parser.add_argument('--debug', action='store_true',
@@ -397,18 +534,37 @@ def main():
         vault_addr=args.vault_addr,
         vault_token=vault_token,
         management_context=args.management_context,
-        dry_run=args.dry_run
+        dry_run=args.dry_run,
+        k8s_backend=args.k8s_backend,
+        wait_timeout=args.wait_timeout,
+        max_parallel=args.max_parallel
     )
 
-    success = updater.update_cluster_kubeconfig(
-        cluster_name=args.cluster_name,
-        namespace=args.namespace,
-        vault_path=args.vault_path,
-        vault_key=args.vault_key,
-        skip_readiness_check=args.skip_readiness_check
-    )
+    if args.from_tofu_output:
+        try:
+            cluster_names = tofu_cluster_names(args.tofu_dir)
+        except (subprocess.CalledProcessError, OSError, ValueError) as e:
+            print(f"Error: could not read proxmox_cluster_names from tofu output: {getattr(e, 'stderr', None) or e}")
+            sys.exit(1)
+        if not cluster_names:
+            print("No clusters in proxmox_cluster_names, nothing to update")
+            sys.exit(0)
+    else:
+        cluster_names = args.clusters or [args.cluster_name]
+
+    clusters = [(name, args.namespace.replace('{cluster}', name)) for name in cluster_names]
+
+    try:
+        outcome = updater.update_clusters_kubeconfig(
+            clusters=clusters,
+            vault_path=args.vault_path,
+            vault_key=args.vault_key,
+            skip_readiness_check=args.skip_readiness_check
+        )
+    finally:
+        updater.close()
 
-    sys.exit(0 if success else 1)
+    sys.exit(EXIT_STATUS[outcome])
 
 
 if __name__ == "__main__":
@@ -14,8 +14,8 @@ echo ""
 # Setup Vault credentials
 export VAULT_ADDR=https://vault.toolz.homelabz.eu
 if [ -z "${VAULT_TOKEN:-}" ]; then
-    echo "Reading VAULT_TOKEN from clusters/tmp/common_secrets.json..."
-    export VAULT_TOKEN=$(jq -r '."kv/cluster-secret-store/secrets/VAULT_TOKEN".VAULT_TOKEN' clusters/tmp/common_secrets.json)
+    echo "Reading VAULT_TOKEN from clusters/tmp/secrets.json..."
+    export VAULT_TOKEN=$(jq -r '."kv/cluster-secret-store/secrets/VAULT_TOKEN".VAULT_TOKEN' clusters/tmp/secrets.json)
 fi
 
 # Step 1: Delete Cluster API resources
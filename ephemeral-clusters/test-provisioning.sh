@@ -19,8 +19,8 @@ echo ""
 # Setup Vault credentials
 export VAULT_ADDR=https://vault.toolz.homelabz.eu
 if [ -z "${VAULT_TOKEN:-}" ]; then
-    echo "Reading VAULT_TOKEN from clusters/tmp/common_secrets.json..."
-    export VAULT_TOKEN=$(jq -r '."kv/cluster-secret-store/secrets/VAULT_TOKEN".VAULT_TOKEN' clusters/tmp/common_secrets.json)
+    echo "Reading VAULT_TOKEN from clusters/tmp/secrets.json..."
+    export VAULT_TOKEN=$(jq -r '."kv/cluster-secret-store/secrets/VAULT_TOKEN".VAULT_TOKEN' clusters/tmp/secrets.json)
 fi
 
 # Step 1: Check capacity
@@ -90,7 +90,7 @@ echo ""
 
 # Step 8: Create Cloudflare secret
 echo "Step 8: Creating Cloudflare API token secret..."
-CF_TOKEN=$(jq -r '."kv/cloudflare"."api-token"' clusters/tmp/common_secrets.json)
+CF_TOKEN=$(jq -r '."kv/cloudflare"."api-token"' clusters/tmp/secrets.json)
 kubectl create namespace external-dns \
     --kubeconfig /tmp/${CLUSTER_NAME}-kubeconfig \
     --dry-run=client -o yaml | kubectl apply --kubeconfig /tmp/${CLUSTER_NAME}-kubeconfig -f -
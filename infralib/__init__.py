@@ -0,0 +1,6 @@
+"""
+Shared helpers for the infra Python scripts.
+
+Scripts outside the repository root put the root on sys.path before
+importing from this package.
+"""
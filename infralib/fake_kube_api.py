@@ -0,0 +1,258 @@
+"""
+In-process stand-in for the parts of a management cluster's API the
+kubeconfig updater reads.
+
+FakeKubeAPI serves Secrets and Cluster API Clusters over plain HTTP on a
+local port and writes a kubeconfig context pointing at itself, so
+TalosKubeconfigUpdater (and kube_api.KubeClient) can be exercised without a
+real cluster:
+
+    with FakeKubeAPI() as api:
+        api.add_cluster('dev', 'dev', kubeconfig_text)
+        api.write_kubeconfig('/tmp/kubeconfig', context='tools')
+
+Single objects, name-filtered lists (fieldSelector=metadata.name=...) and
+watches are served, each object carrying a resourceVersion. watch=False makes
+watch requests fail with 405, like a proxy that cannot stream, and
+allow_list=False refuses lists and watches with 403, like RBAC that only
+grants get, so the polling fallback can be exercised. Clusters are served
+in every version of cluster_api_versions, the first being the one discovery
+(GET /apis/cluster.x-k8s.io) reports as preferred. Requests must carry the
+bearer token; latency can be injected per request.
+"""
+
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from infralib import yaml_codec
+from infralib.kube_api import CLUSTER_API_GROUP, CLUSTER_API_VERSION
+
+
+class FakeKubeAPI:
+    """Secrets and Clusters served on 127.0.0.1, started and stopped in-process"""
+
+    def __init__(self, token: str = 'fake-token', port: int = 0, latency: float = 0.0, watch: bool = True,
+                 allow_list: bool = True, cluster_api_versions: tuple = (CLUSTER_API_VERSION,)):
+        self.token = token
+        self.latency = latency
+        self.watch = watch
+        self.allow_list = allow_list
+        self.cluster_api_versions = tuple(cluster_api_versions)
+        self.requests = 0
+        # (kind, namespace, name) -> object
+        self._objects = {}
+        # (resourceVersion, type, key, object) of every change, for watches
+        self._events = []
+        self._version = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._thread = None
+        self._stopping = False
+
+        handler = type('Handler', (_Handler,), {'api': self})
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeKubeAPI':
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _record(self, event_type: str, key: tuple, obj: dict):
+        # Caller holds the lock
+        self._version += 1
+        obj['metadata']['resourceVersion'] = str(self._version)
+        self._events.append((self._version, event_type, key, obj))
+        self._changed.notify_all()
+
+    def put(self, kind: str, namespace: str, name: str, obj: dict):
+        obj.setdefault('metadata', {}).update({'name': name, 'namespace': namespace})
+        key = (kind, namespace, name)
+        with self._lock:
+            event_type = 'MODIFIED' if key in self._objects else 'ADDED'
+            self._objects[key] = obj
+            self._record(event_type, key, obj)
+
+    def delete(self, kind: str, namespace: str, name: str):
+        key = (kind, namespace, name)
+        with self._lock:
+            obj = self._objects.pop(key, None)
+            if obj is not None:
+                self._record('DELETED', key, dict(obj, metadata=dict(obj['metadata'])))
+
+    def add_secret(self, namespace: str, name: str, data: dict):
+        """Secret whose data values are given as text"""
+        encoded = {key: base64.b64encode(value.encode()).decode() for key, value in data.items()}
+        self.put('secrets', namespace, name, {'apiVersion': 'v1', 'kind': 'Secret', 'data': encoded})
+
+    def set_cluster_phase(self, namespace: str, name: str, phase: str):
+        api_version = f"{CLUSTER_API_GROUP}/{self.cluster_api_versions[0]}"
+        self.put('clusters', namespace, name, {'apiVersion': api_version, 'kind': 'Cluster',
+                                               'status': {'phase': phase}})
+
+    def add_cluster(self, namespace: str, name: str, kubeconfig: str, phase: str = 'Provisioned'):
+        """A provisioned Cluster API cluster with its <name>-kubeconfig secret"""
+        self.set_cluster_phase(namespace, name, phase)
+        self.add_secret(namespace, f"{name}-kubeconfig", {'value': kubeconfig})
+
+    def kubeconfig(self, context: str = 'fake') -> dict:
+        return {
+            'apiVersion': 'v1',
+            'kind': 'Config',
+            'clusters': [{'name': context, 'cluster': {'server': self.url}}],
+            'users': [{'name': context, 'user': {'token': self.token}}],
+            'contexts': [{'name': context, 'context': {'cluster': context, 'user': context}}],
+            'current-context': context,
+        }
+
+    def write_kubeconfig(self, path: str, context: str = 'fake'):
+        with open(path, 'w') as f:
+            yaml_codec.dump(self.kubeconfig(context), f)
+
+    def handle(self, method: str, raw_path: str, authorization: str):
+        """
+        Serve one API request; returns (status, response body), where the
+        body of a watch is an iterator of events
+        """
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if authorization != f"Bearer {self.token}":
+            return 401, _status(401, 'Unauthorized', 'Unauthorized')
+        if method != 'GET':
+            return 405, _status(405, 'MethodNotAllowed', f"{method} is not supported")
+
+        url = urlsplit(raw_path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        if parts == ['apis', CLUSTER_API_GROUP]:
+            return 200, self._api_group()
+        if len(parts) in (5, 6) and parts[:2] == ['api', 'v1'] and parts[2] == 'namespaces':
+            kind, namespace, name = parts[4], parts[3], (parts[5:] or [None])[0]
+        elif (len(parts) in (6, 7) and parts[:2] == ['apis', CLUSTER_API_GROUP]
+              and parts[2] in self.cluster_api_versions and parts[3] == 'namespaces'):
+            kind, namespace, name = parts[5], parts[4], (parts[6:] or [None])[0]
+        else:
+            return 404, _status(404, 'NotFound', 'the server could not find the requested resource')
+
+        if name is None:
+            if not self.allow_list:
+                return 403, _status(403, 'Forbidden', f'cannot list resource "{kind}" in namespace "{namespace}"')
+            selector = query.get('fieldSelector', '')
+            if selector and not selector.startswith('metadata.name='):
+                return 400, _status(400, 'BadRequest', f"unsupported field selector {selector}")
+            name = selector[len('metadata.name='):] or None
+            if query.get('watch') in ('1', 'true'):
+                if not self.watch:
+                    return 405, _status(405, 'MethodNotAllowed', 'watch is not supported')
+                return 200, self._watch(kind, namespace, name, int(query.get('resourceVersion') or 0),
+                                        float(query.get('timeoutSeconds') or 60))
+            return 200, self._list(kind, namespace, name)
+
+        with self._lock:
+            obj = self._objects.get((kind, namespace, name))
+        if obj is None:
+            return 404, _status(404, 'NotFound', f'{kind} "{name}" not found')
+        return 200, obj
+
+    def _api_group(self) -> dict:
+        versions = [{'groupVersion': f"{CLUSTER_API_GROUP}/{version}", 'version': version}
+                    for version in self.cluster_api_versions]
+        return {'kind': 'APIGroup', 'apiVersion': 'v1', 'name': CLUSTER_API_GROUP,
+                'versions': versions, 'preferredVersion': versions[0]}
+
+    def _list(self, kind: str, namespace: str, name: str = None) -> dict:
+        with self._lock:
+            items = [obj for (k, ns, n), obj in sorted(self._objects.items())
+                     if k == kind and ns == namespace and name in (None, n)]
+            version = self._version
+        return {'kind': 'List', 'apiVersion': 'v1',
+                'metadata': {'resourceVersion': str(version)}, 'items': items}
+
+    def _watch(self, kind: str, namespace: str, name: str, since: int, timeout: float):
+        """Events for matching objects after resourceVersion `since`, until timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._changed:
+                while not self._stopping and (not self._events or self._events[-1][0] <= since):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    self._changed.wait(remaining)
+                if self._stopping:
+                    return
+                events = [event for event in self._events if event[0] > since]
+            for version, event_type, (k, ns, n), obj in events:
+                since = version
+                if k == kind and ns == namespace and name in (None, n):
+                    yield {'type': event_type, 'object': obj}
+
+def _status(code: int, reason: str, message: str) -> dict:
+    return {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure',
+            'reason': reason, 'message': message, 'code': code}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, keep-alive
+    # clients wait for a delayed ACK on every response
+    disable_nagle_algorithm = True
+    api = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _serve(self):
+        status, response = self.api.handle(self.command, self.path, self.headers.get('Authorization'))
+        if not isinstance(response, dict):
+            self._stream(status, response)
+            return
+        payload = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, status, events):
+        """Send watch events as chunked JSON lines"""
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for event in events:
+                line = json.dumps(event).encode() + b'\n'
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b'\r\n')
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    do_GET = do_POST = do_PUT = do_DELETE = _serve
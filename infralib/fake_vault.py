@@ -0,0 +1,369 @@
+"""
+In-process stand-in for the parts of Vault the infra scripts use.
+
+FakeVault serves one KV v2 mount over HTTP on a local port so that
+secrets_extract.py and the kubeconfig updaters can be exercised without
+vault.toolz.homelabz.eu:
+
+- list (LIST or GET ?list=true on metadata/<dir>/),
+- read (GET data/<path>, optionally ?version=N),
+- create_or_update (POST/PUT data/<path>, honouring options.cas),
+- read metadata (GET metadata/<path>) and soft delete (DELETE data/<path>),
+- token lookup-self, so hvac's is_authenticated() works.
+
+Latency and failures can be injected to see how callers behave against a
+slow or struggling server. Run it standalone for manual testing:
+
+    python3 -m infralib.fake_vault --port 8200 --secrets 1000
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+CAS_MISMATCH = "check-and-set parameter did not match the current version"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class _Secret:
+    """Version history of one KV v2 path"""
+
+    def __init__(self):
+        self.versions = {}
+        self.current_version = 0
+        self.created_time = _now()
+        self.updated_time = self.created_time
+
+    def write(self, data: dict) -> dict:
+        self.current_version += 1
+        self.updated_time = _now()
+        self.versions[self.current_version] = {
+            'data': data,
+            'created_time': self.updated_time,
+            'deletion_time': '',
+            'destroyed': False,
+        }
+        return self.version_metadata(self.current_version)
+
+    def version_metadata(self, version: int) -> dict:
+        entry = self.versions[version]
+        return {
+            'version': version,
+            'created_time': entry['created_time'],
+            'deletion_time': entry['deletion_time'],
+            'destroyed': entry['destroyed'],
+            'custom_metadata': None,
+        }
+
+    def metadata(self) -> dict:
+        return {
+            'current_version': self.current_version,
+            'oldest_version': min(self.versions, default=0),
+            'created_time': self.created_time,
+            'updated_time': self.updated_time,
+            'max_versions': 0,
+            'cas_required': False,
+            'delete_version_after': '0s',
+            'custom_metadata': None,
+            'versions': {
+                str(version): {key: value for key, value in self.version_metadata(version).items()
+                               if key in ('created_time', 'deletion_time', 'destroyed')}
+                for version in self.versions
+            },
+        }
+
+
+class FakeVault:
+    """
+    KV v2 mount served on 127.0.0.1, started and stopped in-process.
+
+    latency: seconds added to every KV request
+    error_rate: fraction of KV requests answered with error_status
+    max_in_flight: answer 429 while more KV requests than this are being served (0: no limit)
+    fail_paths: path prefixes (below the mount) whose requests always fail with 500
+    """
+
+    def __init__(self, mount: str = 'kv', token: str = 'root', port: int = 0,
+                 latency: float = 0.0, error_rate: float = 0.0, error_status: int = 500,
+                 max_in_flight: int = 0, fail_paths=()):
+        self.mount = mount
+        self.token = token
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_in_flight = max_in_flight
+        self.fail_paths = set(fail_paths)
+        self.stats = {'list': 0, 'read': 0, 'write': 0, 'metadata': 0, 'delete': 0,
+                      'cas_conflicts': 0, 'injected_errors': 0, 'throttled': 0}
+
+        self._secrets = {}
+        # directory -> immediate children, with a trailing '/' on subdirectories
+        self._children = {'': set()}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._thread = None
+
+        handler = type('Handler', (_Handler,), {'vault': self})
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeVault':
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def seed(self, secrets: dict):
+        """Write {path: data} directly, without going through HTTP"""
+        with self._lock:
+            for path, data in secrets.items():
+                self._write(path, dict(data))
+
+    def read(self, path: str, version: int = None) -> dict:
+        """Data of the current (or given) version of path, None if missing or deleted"""
+        with self._lock:
+            secret = self._secrets.get(path)
+            if not secret or not secret.versions:
+                return None
+            entry = secret.versions.get(version or secret.current_version)
+            if not entry or entry['deletion_time'] or entry['destroyed']:
+                return None
+            return dict(entry['data'])
+
+    def paths(self) -> list:
+        with self._lock:
+            return sorted(self._secrets)
+
+    def _write(self, path: str, data: dict) -> dict:
+        secret = self._secrets.get(path)
+        if secret is None:
+            secret = self._secrets[path] = _Secret()
+            parts = path.split('/')
+            for depth in range(len(parts)):
+                directory = ''.join(f"{part}/" for part in parts[:depth])
+                child = parts[depth] + ('/' if depth < len(parts) - 1 else '')
+                self._children.setdefault(directory, set()).add(child)
+        return secret.write(data)
+
+    def _injected_error(self, path: str):
+        """Status and message to fail this request with, or None"""
+        if any(path.startswith(prefix) for prefix in self.fail_paths):
+            return 500, "injected failure"
+        if self.error_rate and random.random() < self.error_rate:
+            return self.error_status, "injected error"
+        return None
+
+    def handle(self, method: str, raw_path: str, token: str, body: dict):
+        """Serve one API request; returns (status, response body or None)"""
+        url = urlsplit(raw_path)
+        query = parse_qs(url.query)
+        path = url.path.rstrip('/') if url.path != '/' else url.path
+        if token != self.token:
+            return 403, {'errors': ['permission denied']}
+
+        if path == '/v1/auth/token/lookup-self':
+            return 200, {'data': {'id': self.token, 'policies': ['root'], 'ttl': 0}}
+
+        mount_prefix = f"/v1/{self.mount}/"
+        if not path.startswith(mount_prefix):
+            return 404, {'errors': [f"no handler for route '{path[4:]}'"]}
+        kind, _, secret_path = path[len(mount_prefix):].partition('/')
+        if kind not in ('data', 'metadata'):
+            return 404, {'errors': [f"no handler for route '{path[4:]}'"]}
+
+        with self._lock:
+            self._in_flight += 1
+            in_flight = self._in_flight
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if self.max_in_flight and in_flight > self.max_in_flight:
+                with self._lock:
+                    self.stats['throttled'] += 1
+                return 429, {'errors': ['request path: rate limit quota exceeded']}
+            error = self._injected_error(secret_path)
+            if error:
+                with self._lock:
+                    self.stats['injected_errors'] += 1
+                return error[0], {'errors': [error[1]]}
+
+            listing = method == 'LIST' or query.get('list') == ['true']
+            with self._lock:
+                if kind == 'metadata' and listing:
+                    return self._list(secret_path)
+                if kind == 'metadata' and method == 'GET':
+                    return self._metadata(secret_path)
+                if kind == 'data' and method == 'GET':
+                    version = int(query['version'][0]) if 'version' in query else None
+                    return self._read(secret_path, version)
+                if kind == 'data' and method in ('POST', 'PUT'):
+                    return self._create_or_update(secret_path, body or {})
+                if kind == 'data' and method == 'DELETE':
+                    return self._delete(secret_path)
+            return 405, {'errors': ['unsupported operation']}
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    # The handlers below run with self._lock held
+
+    def _list(self, directory: str):
+        self.stats['list'] += 1
+        directory = f"{directory}/" if directory else ''
+        keys = self._children.get(directory)
+        if not keys:
+            return 404, {'errors': []}
+        return 200, {'data': {'keys': sorted(keys)}}
+
+    def _metadata(self, path: str):
+        self.stats['metadata'] += 1
+        secret = self._secrets.get(path)
+        if secret is None:
+            return 404, {'errors': []}
+        return 200, {'data': secret.metadata()}
+
+    def _read(self, path: str, version: int = None):
+        self.stats['read'] += 1
+        secret = self._secrets.get(path)
+        if secret is None:
+            return 404, {'errors': []}
+        version = version or secret.current_version
+        if version not in secret.versions:
+            return 404, {'errors': []}
+        entry = secret.versions[version]
+        metadata = secret.version_metadata(version)
+        if entry['deletion_time'] or entry['destroyed']:
+            return 404, {'data': {'data': None, 'metadata': metadata}}
+        return 200, {'data': {'data': entry['data'], 'metadata': metadata}}
+
+    def _create_or_update(self, path: str, body: dict):
+        self.stats['write'] += 1
+        data = body.get('data')
+        if not isinstance(data, dict):
+            return 400, {'errors': ['no data provided']}
+        cas = (body.get('options') or {}).get('cas')
+        if cas is not None:
+            secret = self._secrets.get(path)
+            current = secret.current_version if secret else 0
+            if int(cas) != current:
+                self.stats['cas_conflicts'] += 1
+                return 400, {'errors': [CAS_MISMATCH]}
+        return 200, {'data': self._write(path, data)}
+
+    def _delete(self, path: str):
+        self.stats['delete'] += 1
+        secret = self._secrets.get(path)
+        if secret and secret.versions:
+            secret.versions[secret.current_version]['deletion_time'] = _now()
+        return 204, None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, keep-alive
+    # clients wait for a delayed ACK on every response
+    disable_nagle_algorithm = True
+    vault = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _serve(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = None
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except ValueError:
+                self._send(400, {'errors': ['failed to parse JSON input']})
+                return
+        status, response = self.vault.handle(self.command, self.path, self.headers.get('X-Vault-Token'), body)
+        self._send(status, response)
+
+    def _send(self, status: int, response):
+        payload = json.dumps(response).encode() if response is not None else b''
+        self.send_response(status)
+        if payload:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_LIST = do_POST = do_PUT = do_DELETE = _serve
+
+
+def generate_secrets(count: int, fanout: int = 10, keys: int = 3) -> dict:
+    """
+    {path: data} for `count` synthetic secrets laid out like the real tree:
+    apps/<environment>/ (so secrets_extract's default routes place them), then
+    `fanout`-wide app directories
+    """
+    environments = ('dev', 'stg', 'prod', 'common')
+    secrets = {}
+    for i in range(count):
+        env = environments[i % len(environments)]
+        app = f"app-{(i // len(environments)) % fanout}"
+        secrets[f"apps/{env}/{app}/secret-{i}"] = {f"KEY_{j}": f"value-{i}-{j}" for j in range(keys)}
+    return secrets
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a local KV v2 Vault stand-in for testing the infra scripts')
+    parser.add_argument('--port', type=int, default=8200, help='Port to listen on (default: 8200)')
+    parser.add_argument('--token', default='root', help='Token clients must send (default: root)')
+    parser.add_argument('--mount', default='kv', help='KV v2 mount point (default: kv)')
+    parser.add_argument('--secrets', type=int, default=0, help='Number of synthetic secrets to seed')
+    parser.add_argument('--seed-file', help='JSON file of {path: data} to seed')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every KV request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of KV requests that fail')
+    parser.add_argument('--error-status', type=int, default=500, help='HTTP status of injected failures (default: 500)')
+    parser.add_argument('--max-in-flight', type=int, default=0,
+                        help='Answer 429 above this many concurrent KV requests (default: no limit)')
+    parser.add_argument('--fail-path', action='append', default=[],
+                        help='Path prefix below the mount whose requests always fail (repeatable)')
+    args = parser.parse_args()
+
+    vault = FakeVault(mount=args.mount, token=args.token, port=args.port, latency=args.latency,
+                      error_rate=args.error_rate, error_status=args.error_status,
+                      max_in_flight=args.max_in_flight, fail_paths=args.fail_path)
+    vault.seed(generate_secrets(args.secrets))
+    if args.seed_file:
+        with open(args.seed_file) as f:
+            vault.seed(json.load(f))
+
+    print(f"Serving {len(vault.paths())} secrets on {vault.url} (mount {args.mount}, token {args.token})")
+    try:
+        vault.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        vault.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Wait for changes under directory trees.
+
+Uses Linux inotify through ctypes when available and falls back to polling
+file modification times elsewhere (e.g. macOS), so callers only see sets of
+changed paths.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class TreeWatcher:
+    """Report paths changed under a set of directory trees"""
+
+    def __init__(self, roots: list, poll_interval: float = 1.0):
+        self.roots = list(roots)
+        self.poll_interval = poll_interval
+        self.fd = None
+        self.watches = {}
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            self._inotify_add_watch = libc.inotify_add_watch
+            self._inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            fd = libc.inotify_init1(IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            self.fd = fd
+            self.rescan()
+        except (OSError, AttributeError, TypeError):
+            self.fd = None
+            self._mtimes = self._scan_mtimes()
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self.fd is not None
+
+    def rescan(self):
+        """Watch every directory currently under the roots, including newly created ones"""
+        if self.fd is None:
+            return
+        watched = set(self.watches.values())
+        for root in self.roots:
+            for directory, _, _ in os.walk(root):
+                if directory not in watched:
+                    wd = self._inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+                    if wd >= 0:
+                        self.watches[wd] = directory
+
+    def wait(self, debounce: float = 0.2) -> set:
+        """Block until something changes, then return the changed paths after a short quiet period"""
+        if self.fd is None:
+            return self._poll()
+
+        changed = self._read_events(timeout=None)
+        while True:
+            more = self._read_events(timeout=debounce)
+            if not more:
+                break
+            changed |= more
+        self.rescan()
+        return changed
+
+    def _read_events(self, timeout) -> set:
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b'\0')
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped; report the roots so callers rescan everything
+                changed.update(self.roots)
+                continue
+
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                del self.watches[wd]
+            changed.add(os.path.join(directory, os.fsdecode(name)) if name else directory)
+        return changed
+
+    def _scan_mtimes(self) -> dict:
+        mtimes = {}
+        for root in self.roots:
+            for directory, _, files in os.walk(root):
+                for file in files:
+                    path = os.path.join(directory, file)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    mtimes[path] = (st.st_mtime_ns, st.st_size)
+        return mtimes
+
+    def _poll(self) -> set:
+        while True:
+            time.sleep(self.poll_interval)
+            mtimes = self._scan_mtimes()
+            changed = {path for path in mtimes.keys() | self._mtimes.keys()
+                       if mtimes.get(path) != self._mtimes.get(path)}
+            self._mtimes = mtimes
+            if changed:
+                return changed
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
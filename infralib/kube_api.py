@@ -0,0 +1,239 @@
+"""
+Minimal Kubernetes API client built from a kubeconfig context.
+
+KubeClient talks to one cluster over a pooled requests session, with the
+server, CA and credentials of a named context, so nothing shells out to
+kubectl and the kubeconfig's current-context is never touched. Several
+clients for different contexts can be used at once.
+
+Supports token, token file, basic auth and client certificate credentials,
+inline (*-data) or as files. Contexts whose user authenticates through an
+exec plugin or auth provider raise UnsupportedAuthError so callers can fall
+back to kubectl.
+
+Cluster API objects are read in the version the API server prefers, found
+through discovery on first use, so clusters created from v1beta1 and v1beta2
+templates are read the same way.
+"""
+
+import base64
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from infralib import yaml_codec
+
+CLUSTER_API_GROUP = 'cluster.x-k8s.io'
+# Used when discovery is not allowed; the version the cluster templates are moving to
+CLUSTER_API_VERSION = 'v1beta2'
+
+# API group of each resource kind the scripts read ('' is the core group) and its default version
+RESOURCE_GROUPS = {
+    'secrets': ('', 'v1'),
+    'clusters': (CLUSTER_API_GROUP, CLUSTER_API_VERSION),
+}
+
+
+def resource_path(kind: str, namespace: str, name: str = None, version: str = None) -> str:
+    """
+    Collection path of kind in namespace, or the path of one object when
+    name is given, in `version` or the kind's default version
+    """
+    group, default_version = RESOURCE_GROUPS[kind]
+    prefix = f"/apis/{group}/{version or default_version}" if group else f"/api/{version or default_version}"
+    path = f"{prefix}/namespaces/{quote(namespace)}/{kind}"
+    return f"{path}/{quote(name)}" if name else path
+
+
+class KubeAPIError(Exception):
+    """Non-2xx answer from the API server"""
+
+    def __init__(self, status: int, reason: str, message: str):
+        super().__init__(f"{status} {reason}: {message}")
+        self.status = status
+        self.reason = reason
+        self.message = message
+
+
+class UnsupportedAuthError(ValueError):
+    """The context's credentials need kubectl (exec plugin, auth provider)"""
+
+
+def kubeconfig_paths(kubeconfig: str = None) -> list:
+    """Files kubectl would read: the argument, else $KUBECONFIG, else ~/.kube/config"""
+    value = kubeconfig or os.environ.get('KUBECONFIG') or str(Path.home() / '.kube' / 'config')
+    return [path for path in value.split(os.pathsep) if path]
+
+
+def load_kubeconfig(kubeconfig: str = None) -> dict:
+    """
+    Merge the kubeconfig files like kubectl: the first file defining a
+    name wins. Each entry remembers the directory of the file it came from,
+    since relative certificate paths are relative to it.
+    """
+    merged = {'clusters': {}, 'contexts': {}, 'users': {}}
+    for path in kubeconfig_paths(kubeconfig):
+        try:
+            with open(path) as f:
+                config = yaml_codec.load(f) or {}
+        except FileNotFoundError:
+            continue
+        base_dir = os.path.dirname(os.path.abspath(path))
+        for section, entries in merged.items():
+            for item in config.get(section) or []:
+                if item.get('name') and item['name'] not in entries:
+                    key = section[:-1]
+                    entries[item['name']] = dict(item.get(key) or {}, _base_dir=base_dir)
+    return merged
+
+
+class KubeClient:
+    """GET access to one cluster's API, shared safely between threads"""
+
+    def __init__(self, server: str, token: str = None, auth: tuple = None, cert: tuple = None,
+                 verify=True, timeout: float = 30.0, pool_size: int = 4, temp_dir: str = None):
+        self.server = server.rstrip('/')
+        self.timeout = timeout
+        self._temp_dir = temp_dir
+        # API group -> version the server prefers, discovered on first use
+        self._versions = {}
+        self._versions_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.verify = verify
+        self.session.cert = cert
+        self.session.auth = auth
+        self.session.headers['Accept'] = 'application/json'
+        if token:
+            self.session.headers['Authorization'] = f"Bearer {token}"
+
+    @classmethod
+    def from_context(cls, context: str, kubeconfig: str = None, **kwargs) -> 'KubeClient':
+        config = load_kubeconfig(kubeconfig)
+        if context not in config['contexts']:
+            raise ValueError(f"Context '{context}' not found in kubeconfig. "
+                             f"Available contexts: {', '.join(config['contexts'])}")
+        ctx = config['contexts'][context]
+        cluster = config['clusters'].get(ctx.get('cluster'))
+        if not cluster or not cluster.get('server'):
+            raise ValueError(f"Context '{context}' refers to unknown cluster '{ctx.get('cluster')}'")
+        user = config['users'].get(ctx.get('user'), {})
+        if user.get('exec') or user.get('auth-provider'):
+            raise UnsupportedAuthError(f"User '{ctx.get('user')}' of context '{context}' "
+                                       "authenticates through an exec plugin or auth provider")
+
+        # Inline certificates go to a private directory for the TLS stack, removed by close()
+        temp_dir = None
+
+        def material(entry, key):
+            nonlocal temp_dir
+            if entry.get(f'{key}-data'):
+                if temp_dir is None:
+                    temp_dir = tempfile.mkdtemp(prefix='kube-api-')
+                path = os.path.join(temp_dir, key)
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(base64.b64decode(entry[f'{key}-data']))
+                return path
+            if entry.get(key):
+                return os.path.join(entry['_base_dir'], os.path.expanduser(entry[key]))
+            return None
+
+        try:
+            if cluster.get('insecure-skip-tls-verify'):
+                verify = False
+            else:
+                verify = material(cluster, 'certificate-authority') or True
+
+            token = user.get('token')
+            if not token and user.get('tokenFile'):
+                with open(os.path.join(user['_base_dir'], user['tokenFile'])) as f:
+                    token = f.read().strip()
+
+            auth = (user['username'], user.get('password', '')) if user.get('username') else None
+
+            cert = None
+            certificate = material(user, 'client-certificate')
+            if certificate:
+                cert = (certificate, material(user, 'client-key'))
+
+            return cls(cluster['server'], token=token, auth=auth, cert=cert, verify=verify,
+                       temp_dir=temp_dir, **kwargs)
+        except BaseException:
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def _raise_for_status(response):
+        if response.ok:
+            return
+        try:
+            status = response.json()
+            reason, message = status.get('reason', response.reason), status.get('message', '')
+        except ValueError:
+            reason, message = response.reason, response.text.strip()
+        raise KubeAPIError(response.status_code, reason, message)
+
+    def get(self, path: str, params: dict = None) -> dict:
+        response = self.session.get(f"{self.server}{path}", params=params, timeout=self.timeout)
+        self._raise_for_status(response)
+        return response.json()
+
+    def preferred_version(self, group: str, default: str) -> str:
+        """Version of an API group the server prefers, or default when it cannot be discovered"""
+        with self._versions_lock:
+            if group in self._versions:
+                return self._versions[group]
+        try:
+            version = (self.get(f"/apis/{group}").get('preferredVersion') or {}).get('version') or default
+        except KubeAPIError as e:
+            # Discovery can be forbidden where the objects themselves are readable
+            if e.status not in (401, 403, 404):
+                raise
+            version = default
+        with self._versions_lock:
+            return self._versions.setdefault(group, version)
+
+    def resource_path(self, kind: str, namespace: str, name: str = None) -> str:
+        """resource_path() in the version of kind's API group this server prefers"""
+        group, default_version = RESOURCE_GROUPS[kind]
+        version = self.preferred_version(group, default_version) if group else default_version
+        return resource_path(kind, namespace, name, version)
+
+    def watch(self, path: str, resource_version: str, params: dict = None, timeout: float = 60.0):
+        """
+        Yield the watch events ({'type': ..., 'object': ...}) of a collection
+        after resource_version, until the server ends the watch after about
+        `timeout` seconds or the caller stops iterating
+        """
+        params = dict(params or {}, watch='1', resourceVersion=resource_version,
+                      allowWatchBookmarks='true', timeoutSeconds=str(max(1, int(timeout))))
+        # The read timeout only has to outlast the server-side timeout
+        with self.session.get(f"{self.server}{path}", params=params, stream=True,
+                              timeout=(self.timeout, timeout + self.timeout)) as response:
+            self._raise_for_status(response)
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def close(self):
+        self.session.close()
+        if self._temp_dir:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
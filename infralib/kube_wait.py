@@ -0,0 +1,95 @@
+"""
+Wait for a Kubernetes object to reach a state, up to a deadline.
+
+watch_until() lists the object to learn its current state and resource
+version, then follows the watch API, so it returns as soon as the API server
+reports the change. When listing or watching is not possible (RBAC only
+grants get, the server refuses to watch or the connection drops) it falls
+back to poll_until(), which re-reads the object with exponential backoff
+capped at one second.
+
+Deadlines are time.monotonic() values. Both functions return the last
+object seen (None if it does not exist), whether or not it satisfies the
+predicate, so callers can tell "not there" from "not ready".
+"""
+
+import random
+import time
+
+import requests
+
+from infralib import kube_api
+
+# Answers to a list that mean "not allowed here" (RBAC limited to get, or a
+# proxy that only forwards single objects) rather than a broken cluster
+LIST_REFUSED = {401, 403, 405}
+
+# Polling delays: start small for objects that are about to appear, cap at a
+# second so a change is picked up within about a second
+POLL_INITIAL = 0.1
+POLL_MAXIMUM = 1.0
+
+
+def poll_until(fetch, predicate, deadline: float, initial: float = POLL_INITIAL, maximum: float = POLL_MAXIMUM):
+    """Call fetch() until predicate(object) holds or the deadline passes"""
+    delay = initial
+    while True:
+        obj = fetch()
+        remaining = deadline - time.monotonic()
+        if predicate(obj) or remaining <= 0:
+            return obj
+        # Jitter keeps parallel waiters from polling in lockstep
+        time.sleep(min(remaining, delay * random.uniform(0.5, 1.0)))
+        delay = min(maximum, delay * 2)
+
+
+def _get_object(client, kind: str, namespace: str, name: str):
+    try:
+        return client.get(client.resource_path(kind, namespace, name))
+    except kube_api.KubeAPIError as e:
+        if e.status == 404:
+            return None
+        raise
+
+
+def watch_until(client, kind: str, namespace: str, name: str, predicate, deadline: float, logger=None):
+    """Follow the object through the watch API until predicate(object) holds or the deadline passes"""
+    path = client.resource_path(kind, namespace)
+    selector = {'fieldSelector': f"metadata.name={name}"}
+
+    def poll():
+        return poll_until(lambda: _get_object(client, kind, namespace, name), predicate, deadline)
+
+    while True:
+        try:
+            listing = client.get(path, params=selector)
+        except kube_api.KubeAPIError as e:
+            if e.status not in LIST_REFUSED:
+                raise
+            if logger:
+                logger.info(f"Listing {kind} is not allowed ({e}) - polling {kind}/{name} instead")
+            return poll()
+        items = listing.get('items') or []
+        obj = items[0] if items else None
+        remaining = deadline - time.monotonic()
+        if predicate(obj) or remaining <= 0:
+            return obj
+        if remaining < 1:
+            # Watch timeouts are whole seconds; poll what is left
+            return poll()
+
+        try:
+            for event in client.watch(path, listing['metadata']['resourceVersion'], selector, remaining):
+                if event.get('type') in ('ADDED', 'MODIFIED'):
+                    obj = event['object']
+                elif event.get('type') == 'DELETED':
+                    obj = None
+                elif event.get('type') == 'ERROR':
+                    # Usually 410 Gone: the resource version is too old, list again
+                    break
+                if predicate(obj) or time.monotonic() >= deadline:
+                    return obj
+        except (kube_api.KubeAPIError, requests.exceptions.RequestException, ValueError) as e:
+            if logger:
+                logger.info(f"Watching {kind}/{name} failed ({e}) - polling instead")
+            return poll()
@@ -0,0 +1,891 @@
+"""
+Load SOPS-encrypted secrets into the JSON file the OpenTofu stacks read.
+
+Shared by clusters/ and ephemeral-clusters/opentofu/, whose load_secrets.py
+wrappers call main() from their own directory. Both stacks decrypt the same
+secrets tree, so the merged result is kept as a snapshot in the decryption
+cache, stamped with a digest of the input files; the second stack reuses it
+without decrypting anything.
+
+With --watch the loader stays running: it keeps every file's flattened
+secrets in memory, re-decrypts only files inotify reports as changed,
+rewrites the output on change and serves the current snapshot over a Unix
+socket, which one-shot runs with the same settings use instead of decrypting.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import socket
+import tempfile
+import threading
+import subprocess
+import argparse
+import cProfile
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from infralib import inotify, sops_age, tf_references, yaml_codec
+
+# Decrypted entries older than this, or beyond this total size, are evicted
+CACHE_MAX_AGE = 7 * 24 * 3600
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Environment directories loaded by --environment all, in merge order
+ALL_ENVIRONMENTS = ['dev', 'stg', 'prod', 'common']
+
+# Bump when the snapshot layout or flattening rules change
+SNAPSHOT_VERSION = 1
+
+# Name of the --watch socket inside the cache directory
+WATCH_SOCKET_NAME = 'watch.sock'
+
+def default_cache_dir():
+    """Pick a tmpfs location for the decryption cache, or None if there is none"""
+    for base in (os.environ.get('XDG_RUNTIME_DIR'), '/dev/shm'):
+        if base and os.path.isdir(base):
+            return os.path.join(base, f"load_secrets-{os.getuid()}")
+    return None
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load encrypted secrets for Vault bootstrap')
+    parser.add_argument('--environment', default='all',
+                       help='Environment to load (dev, stg, prod, all)')
+    parser.add_argument('--secrets-dir', default='../secrets',
+                       help='Base directory for secrets')
+    parser.add_argument('--output', default='tmp/secrets.json',
+                       help='Output file for processed secrets')
+    parser.add_argument('--env-output-dir',
+                       help='Also write one {env}_secrets.json per environment into this directory')
+    parser.add_argument('--only-referenced', action='store_true',
+                       help='Only decrypt files holding vault paths that the stack .tf files reference')
+    parser.add_argument('--tf-dir', default='.',
+                       help='Stack directory scanned by --only-referenced (default: current directory)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                       help='Number of files to decrypt concurrently (default: CPU count)')
+    parser.add_argument('--cache-dir', default=default_cache_dir(),
+                       help='Directory for cached decryption results (default: tmpfs under $XDG_RUNTIME_DIR or /dev/shm)')
+    cache_mode = parser.add_mutually_exclusive_group()
+    cache_mode.add_argument('--no-cache', action='store_true',
+                       help='Always run sops and do not read or write the cache')
+    cache_mode.add_argument('--rebuild-cache', action='store_true',
+                       help='Discard cached results and decrypt every file again')
+    parser.add_argument('--backend', choices=['auto', 'native', 'sops'], default='auto',
+                       help='Decrypt in-process (native), with the sops binary (sops), or in-process '
+                            'when the cryptography package and an age key are available (auto)')
+    parser.add_argument('--watch', action='store_true',
+                       help='Keep running, re-decrypt changed files and refresh the output and snapshot socket')
+    parser.add_argument('--profile', metavar='FILE',
+                       help='Write per-file decrypt/parse/flatten and per-phase wall times to FILE as JSON '
+                            'and print the slowest files')
+    parser.add_argument('--profile-top', type=int, default=10, metavar='N',
+                       help='Number of slowest files listed by --profile (default: 10)')
+    parser.add_argument('--cprofile', metavar='FILE',
+                       help='Dump cProfile stats for the whole run to FILE (main thread only; '
+                            'use --jobs 1 to include decryption)')
+    parser.add_argument('--socket',
+                       help=f'Unix socket served by --watch and read by one-shot runs '
+                            f'(default: {WATCH_SOCKET_NAME} in the cache directory)')
+    return parser.parse_args()
+
+class DecryptionCache:
+    """
+    Content-addressed cache of flattened secrets.
+
+    Entries are keyed by the SHA-256 of the age key identity and the encrypted
+    file bytes, so any change to either one misses the cache. Plaintext only
+    ever lives in a 0700 directory on tmpfs and is evicted by age and size.
+    """
+
+    def __init__(self, cache_dir, key_identity, max_age=CACHE_MAX_AGE, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.key_identity = key_identity
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        st = os.stat(cache_dir)
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            raise PermissionError(f"Cache directory {cache_dir} must be owned by the current user with mode 0700")
+
+    def key_for(self, file_path):
+        digest = hashlib.sha256(self.key_identity)
+        with open(file_path, 'rb') as f:
+            digest.update(f.read())
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        entry_path = self._entry_path(key)
+        try:
+            if time.time() - os.path.getmtime(entry_path) > self.max_age:
+                self._count(hit=False)
+                return None
+            with open(entry_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self._count(hit=False)
+            return None
+
+        self._count(hit=True)
+        return data
+
+    def put(self, key, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError as e:
+            print(f"Warning: could not write cache entry: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _snapshot_path(self, name):
+        return os.path.join(self.cache_dir, f"snapshot-{name}.json")
+
+    def load_snapshot(self, name, digest):
+        """Return the per-environment secrets saved under name for this input digest, or None"""
+        try:
+            if time.time() - os.path.getmtime(self._snapshot_path(name)) > self.max_age:
+                return None
+            with open(self._snapshot_path(name)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if snapshot.get('digest') != digest:
+            return None
+        return snapshot['environments']
+
+    def save_snapshot(self, name, digest, env_secrets):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'digest': digest, 'environments': env_secrets}, f)
+            os.replace(tmp_path, self._snapshot_path(name))
+        except OSError as e:
+            print(f"Warning: could not write secrets snapshot: {e}")
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name == WATCH_SOCKET_NAME:
+                continue
+            os.unlink(os.path.join(self.cache_dir, name))
+
+    def evict(self):
+        """Drop expired entries, then the least recently written ones until under max_bytes"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name == WATCH_SOCKET_NAME:
+                continue
+            entry_path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(entry_path)
+                if now - st.st_mtime > self.max_age:
+                    os.unlink(entry_path)
+                else:
+                    entries.append((st.st_mtime, st.st_size, entry_path))
+            except FileNotFoundError:
+                continue  # Removed by a concurrent run
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(entry_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+def read_key_identity():
+    """Identify the age key by its contents so rotating SOPS_AGE_KEY_FILE invalidates cached results"""
+    with open(os.environ['SOPS_AGE_KEY_FILE'], 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+def setup_cache(args):
+    """Build the decryption cache from CLI arguments, or return None if caching is off"""
+    if args.no_cache:
+        return None
+    if not args.cache_dir:
+        print("No tmpfs cache directory available - decrypting without cache")
+        return None
+
+    try:
+        cache = DecryptionCache(args.cache_dir, read_key_identity())
+    except OSError as e:
+        print(f"Warning: {e} - decrypting without cache")
+        return None
+
+    if args.rebuild_cache:
+        cache.clear()
+    return cache
+
+def setup_decryptor(backend):
+    """Load the in-process decryptor for --backend, or return None to always use the sops binary"""
+    if backend == 'sops':
+        return None
+
+    try:
+        return sops_age.SopsDecryptor.from_environment()
+    except (ImportError, OSError, ValueError) as e:
+        if backend == 'native':
+            print(f"Error: in-process decryption unavailable: {e}")
+            sys.exit(1)
+        print(f"In-process decryption unavailable ({e}) - using sops binary")
+        return None
+
+class LoadProfile:
+    """
+    Wall-clock timings of one run: named phases, and decrypt/parse/flatten
+    per file. Files are recorded from worker threads, phases from the main one.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.files = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def record_file(self, file_path, timings):
+        timings['total'] = sum(timings.get(stage, 0.0) for stage in ('cache', 'decrypt', 'parse', 'flatten'))
+        with self._lock:
+            self.files[file_path] = timings
+
+    def report(self):
+        return {
+            'total': time.perf_counter() - self.started,
+            'phases': self.phases,
+            'files': self.files,
+        }
+
+    def write(self, output_file):
+        output_dir = os.path.dirname(output_file)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with open(output_file, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+
+    def print_summary(self, top=10):
+        report = self.report()
+        print(f"Profile: {report['total']:.3f}s total")
+        for name, seconds in sorted(report['phases'].items(), key=lambda item: item[1], reverse=True):
+            print(f"  {name:<12} {seconds:8.3f}s")
+
+        slowest = sorted(report['files'].items(), key=lambda item: item[1]['total'], reverse=True)[:top]
+        if slowest:
+            print(f"Slowest {len(slowest)} of {len(report['files'])} files (decrypt / parse / flatten, seconds):")
+        for file_path, timings in slowest:
+            source = 'cache' if timings.get('cached') else timings.get('backend', '?')
+            print(f"  {timings['total']:7.3f}  {timings.get('decrypt', 0.0):7.3f} / {timings.get('parse', 0.0):7.3f}"
+                  f" / {timings.get('flatten', 0.0):7.3f}  [{source}] {file_path}")
+
+def _add_time(timings, stage, start):
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+def decrypt_file(file_path, decryptor=None, timings=None):
+    """Decrypt and parse one file; when given, `timings` accumulates decrypt and parse seconds"""
+    if decryptor:
+        try:
+            start = time.perf_counter()
+            document = sops_age.load_document(file_path)
+            _add_time(timings, 'parse', start)
+
+            start = time.perf_counter()
+            decrypted = decryptor.decrypt_document(document)
+            _add_time(timings, 'decrypt', start)
+            if timings is not None:
+                timings['backend'] = 'native'
+            return decrypted
+        except sops_age.UnsupportedFormatError:
+            pass
+        except (sops_age.SopsDecryptError, ValueError) as e:
+            print(f"In-process decryption failed for {file_path} ({e}), retrying with sops")
+
+    if timings is not None:
+        timings['backend'] = 'sops'
+    if not file_path.endswith(('.yaml', '.yml', '.json')):
+        print(f"Unsupported file format: {file_path}")
+        return None
+    try:
+        start = time.perf_counter()
+        # JSON output, so values come back with the same types as from the
+        # in-process decryption rather than as YAML 1.1 reads them
+        result = subprocess.run(
+            ['sops', '--decrypt', '--output-type', 'json', file_path],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        _add_time(timings, 'decrypt', start)
+
+        start = time.perf_counter()
+        data = json.loads(result.stdout)
+        _add_time(timings, 'parse', start)
+        return data
+    except subprocess.CalledProcessError as e:
+        print(f"Error decrypting {file_path}: {e.stderr}")
+        return None
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        return None
+
+def flatten_vault_structure(data):
+    """
+    Map every vault path in a document to its secrets.
+
+    Under the top-level `vault` key, a mapping whose values are all scalars
+    holds the secrets for the path leading to it, and scalars beside nested
+    mappings are ignored. A scalar directly under `vault` becomes a path
+    holding only itself. Documents without a `vault` mapping contribute
+    nothing. Mappings are the plain dicts the YAML/JSON loaders produce.
+
+    The walk keeps an explicit stack of child iterators plus one shared list
+    of path segments, so deep trees cannot hit the recursion limit and each
+    path string is joined exactly once, at its leaf.
+    """
+    result = {}
+    vault = data.get('vault') if type(data) is dict else None
+    if type(vault) is not dict:
+        return result
+
+    for key, value in vault.items():
+        if type(value) is not dict:
+            result[key] = {key: value}
+            continue
+        if dict not in map(type, value.values()):
+            result[key] = value
+            continue
+
+        segments = [str(key)]
+        stack = [iter(value.items())]
+        while stack:
+            for child_key, child in stack[-1]:
+                if type(child) is not dict:
+                    continue
+                segments.append(child_key if type(child_key) is str else str(child_key))
+                if dict in map(type, child.values()):
+                    # Descend now and resume this iterator afterwards, keeping document order
+                    stack.append(iter(child.items()))
+                    break
+                result['/'.join(segments)] = child
+                segments.pop()
+            else:
+                stack.pop()
+                segments.pop()
+
+    return result
+
+def find_secret_files(env_dir):
+    """Return secret files under env_dir in os.walk order"""
+    file_paths = []
+    for root, _, files in os.walk(env_dir):
+        for file in files:
+            if file.endswith(('.yaml', '.yml', '.json')):
+                file_paths.append(os.path.join(root, file))
+    return file_paths
+
+def find_environment_files(env_dirs):
+    """Walk every environment directory once, returning (env, env_dir, file_path) in merge order"""
+    return [(env, env_dir, file_path)
+            for env, env_dir in env_dirs
+            for file_path in find_secret_files(env_dir)]
+
+def referenced_files(secret_files, refs):
+    """
+    Keep files that contribute a vault path the stack reads. SOPS leaves
+    mapping keys in cleartext, so the paths come from the encrypted file
+    without decrypting it.
+    """
+    selected = []
+    for entry in secret_files:
+        file_path = entry[2]
+        try:
+            with open(file_path) as f:
+                document = json.load(f) if file_path.endswith('.json') else yaml_codec.load(f)
+            vault_paths = flatten_vault_structure(document)
+        except (OSError, ValueError, yaml_codec.YAMLError):
+            selected.append(entry)  # Cannot tell what it holds, so load it
+            continue
+
+        if any(refs.matches(path) for path in vault_paths):
+            selected.append(entry)
+    return selected
+
+def tree_digest(secret_files, key_identity):
+    """
+    Digest the encrypted inputs of a run: environment names, file paths
+    relative to each environment directory and file contents. Paths are
+    relative so both stacks agree even though they reach the secrets
+    directory through different relative paths.
+    """
+    digest = hashlib.sha256(f"v{SNAPSHOT_VERSION}".encode())
+    digest.update(key_identity)
+    for env, env_dir, file_path in secret_files:
+        with open(file_path, 'rb') as f:
+            content_digest = hashlib.sha256(f.read()).hexdigest()
+        digest.update(f"\0{env}\0{os.path.relpath(file_path, env_dir)}\0{content_digest}".encode())
+    return digest.hexdigest()
+
+def load_secret_file(file_path, cache=None, decryptor=None, profile=None):
+    """
+    Decrypt and flatten one file, reusing the cached result when the
+    ciphertext is unchanged. Returns None when the file could not be decrypted.
+    """
+    timings = {} if profile else None
+    try:
+        start = time.perf_counter()
+        cache_key = cache.key_for(file_path) if cache else None
+        if cache_key:
+            cached = cache.get(cache_key)
+            _add_time(timings, 'cache', start)
+            if cached is not None:
+                if timings is not None:
+                    timings['cached'] = True
+                return cached
+
+        decrypted_data = decrypt_file(file_path, decryptor, timings)
+        if decrypted_data is None:
+            return None
+
+        start = time.perf_counter()
+        processed = flatten_vault_structure(decrypted_data)
+        _add_time(timings, 'flatten', start)
+        if cache_key:
+            cache.put(cache_key, processed)
+        return processed
+    finally:
+        if profile:
+            profile.record_file(file_path, timings)
+
+def load_secret_files(file_paths, jobs=1, cache=None, decryptor=None, profile=None):
+    """Load files with up to `jobs` concurrent decryptions, yielding results in input order"""
+    def load(file_path):
+        return load_secret_file(file_path, cache, decryptor, profile)
+
+    if jobs <= 1 or len(file_paths) <= 1:
+        return map(load, file_paths)
+
+    with ThreadPoolExecutor(max_workers=min(jobs, len(file_paths))) as executor:
+        return list(executor.map(load, file_paths))
+
+def load_environments(secret_files, environments, jobs=1, cache=None, decryptor=None, profile=None):
+    """
+    Decrypt every file of every environment as one batch and merge them per
+    environment. Returns (env_secrets, paths of the files that failed to decrypt).
+    """
+    file_paths = [file_path for _, _, file_path in secret_files]
+
+    # Results come back in walk order regardless of which decryption finishes
+    # first, so the merge below is identical to the serial run
+    results = []
+    for file_path, processed in zip(file_paths, load_secret_files(file_paths, jobs, cache, decryptor, profile)):
+        print(f"Processing {file_path}...")
+        results.append(processed)
+
+    failed = [file_path for file_path, processed in zip(file_paths, results) if processed is None]
+    return group_environments(secret_files, environments, results), failed
+
+def group_environments(secret_files, environments, results):
+    """Merge per-file results into one secrets map per environment, in walk order"""
+    env_secrets = {env: {} for env in environments}
+    for (env, _, _), processed in zip(secret_files, results):
+        if not processed:
+            continue
+
+        all_secrets = env_secrets[env]
+        for path, secrets in processed.items():
+            if path not in all_secrets:
+                all_secrets[path] = {}
+            all_secrets[path].update(secrets)
+
+    return env_secrets
+
+def merge_environments(env_secrets):
+    """Combine environments in merge order; a later environment replaces a whole vault path"""
+    all_secrets = {}
+    for secrets in env_secrets.values():
+        all_secrets.update(secrets)
+    return all_secrets
+
+def diff_secrets(old, new):
+    """Vault paths added, removed and modified between two secrets maps"""
+    added = sorted(new.keys() - old.keys())
+    removed = sorted(old.keys() - new.keys())
+    modified = sorted(path for path in new.keys() & old.keys() if new[path] != old[path])
+    return added, removed, modified
+
+def write_secrets(secrets, output_file):
+    """
+    Serialize canonically and replace output_file atomically, but only when
+    its content changes so file watchers and tofu do not see a new file on
+    every run. Reports changed vault paths, never values.
+    """
+    content = json.dumps(secrets, indent=2, sort_keys=True).encode()
+
+    try:
+        with open(output_file, 'rb') as f:
+            existing = f.read()
+    except FileNotFoundError:
+        existing = None
+
+    if existing is not None and hashlib.sha256(existing).digest() == hashlib.sha256(content).digest():
+        print(f"Secrets unchanged in {output_file}")
+        return False
+
+    output_dir = os.path.dirname(output_file) or '.'
+    os.makedirs(output_dir, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, prefix='.secrets-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, output_file)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    if existing is None:
+        print(f"Secrets processed and saved to {output_file} ({len(secrets)} paths)")
+        return True
+
+    try:
+        previous = json.loads(existing)
+    except ValueError:
+        previous = {}
+
+    added, removed, modified = diff_secrets(previous, secrets)
+    print(f"Secrets updated in {output_file}: {len(added)} added, {len(removed)} removed, {len(modified)} modified")
+    for marker, paths in (('+', added), ('-', removed), ('~', modified)):
+        for path in paths:
+            print(f"  {marker} {path}")
+    return True
+
+def write_outputs(env_secrets, args):
+    write_secrets(merge_environments(env_secrets), args.output)
+    if args.env_output_dir:
+        for env, secrets in env_secrets.items():
+            write_secrets(secrets, os.path.join(args.env_output_dir, f"{env}_secrets.json"))
+
+def watch_socket_path(args):
+    if args.socket:
+        return args.socket
+    return os.path.join(args.cache_dir, WATCH_SOCKET_NAME) if args.cache_dir else None
+
+def watch_config(args):
+    """Settings a --watch snapshot depends on; one-shot runs only reuse a snapshot built with the same ones"""
+    return {
+        'version': SNAPSHOT_VERSION,
+        'secrets_dir': os.path.realpath(args.secrets_dir),
+        'environment': args.environment,
+        'tf_dir': os.path.realpath(args.tf_dir) if args.only_referenced else None,
+    }
+
+class SnapshotServer:
+    """
+    Serve the latest snapshot to every client that connects to a Unix socket.
+
+    Each connection receives one JSON document with the watch config, the
+    tree digest and the per-environment secrets, and is then closed. The
+    socket is created with mode 0600.
+    """
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self._payload = b''
+
+        if os.path.exists(socket_path):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    probe.connect(socket_path)
+                raise RuntimeError(f"Another load_secrets --watch is already serving {socket_path}")
+            except ConnectionRefusedError:
+                os.unlink(socket_path)  # Left behind by a process that did not shut down cleanly
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            self._sock.bind(socket_path)
+        finally:
+            os.umask(old_umask)
+        self._sock.listen()
+
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def publish(self, config, digest, env_secrets):
+        self._payload = json.dumps({'config': config, 'digest': digest, 'environments': env_secrets}).encode()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return  # Socket closed
+            with conn:
+                try:
+                    conn.sendall(self._payload)
+                except OSError:
+                    pass
+
+    def close(self):
+        self._sock.close()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+def fetch_snapshot(socket_path, config, digest, timeout=2.0):
+    """Per-environment secrets from a running --watch, or None unless its config and digest match"""
+    try:
+        if os.stat(socket_path).st_uid != os.getuid():
+            print(f"Warning: ignoring {socket_path}, it is not owned by the current user")
+            return None
+
+        chunks = []
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(socket_path)
+            while True:
+                chunk = client.recv(1024 * 1024)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        snapshot = json.loads(b''.join(chunks))
+    except (OSError, ValueError):
+        return None
+
+    if snapshot.get('config') != config or snapshot.get('digest') != digest:
+        return None
+    return snapshot['environments']
+
+def resolve_env_dirs(args):
+    """(env, env_dir) pairs to load, in merge order"""
+    if args.environment == 'all':
+        env_dirs = [(env, os.path.join(args.secrets_dir, env)) for env in ALL_ENVIRONMENTS]
+        return [(env, env_dir) for env, env_dir in env_dirs if os.path.isdir(env_dir)]
+
+    env_dir = os.path.join(args.secrets_dir, args.environment)
+    if not os.path.isdir(env_dir):
+        print(f"Error: Environment directory not found: {env_dir}")
+        sys.exit(1)
+    return [(args.environment, env_dir)]
+
+def select_secret_files(args, env_dirs, profile=None):
+    """Walk the environment directories and apply --only-referenced, returning (secret_files, snapshot_name)"""
+    with profile.phase('walk') if profile else nullcontext():
+        secret_files = find_environment_files(env_dirs)
+    snapshot_name = args.environment
+
+    if args.only_referenced:
+        try:
+            with profile.phase('references') if profile else nullcontext():
+                refs = tf_references.scan_stack(args.tf_dir)
+        except FileNotFoundError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+        if refs.everything:
+            for reason in refs.reasons:
+                print(f"Loading every secret file: {reason}")
+        else:
+            total = len(secret_files)
+            with profile.phase('references') if profile else nullcontext():
+                secret_files = referenced_files(secret_files, refs)
+            print(f"Loading {len(secret_files)} of {total} secret files referenced from {args.tf_dir}")
+
+            selection = hashlib.sha256('\0'.join(path for _, _, path in secret_files).encode())
+            snapshot_name = f"{args.environment}-refs-{selection.hexdigest()[:12]}"
+
+    return secret_files, snapshot_name
+
+def watch(args, env_dirs, cache):
+    """Decrypt once, then refresh the outputs every time files under the environment directories change"""
+    environments = [env for env, _ in env_dirs]
+    key_identity = cache.key_identity if cache else read_key_identity()
+    decryptor = setup_decryptor(args.backend)
+
+    watcher = inotify.TreeWatcher([env_dir for _, env_dir in env_dirs])
+    if not watcher.uses_inotify:
+        print(f"inotify unavailable - polling for changes every {watcher.poll_interval}s")
+
+    socket_path = watch_socket_path(args)
+    server = None
+    if socket_path:
+        try:
+            server = SnapshotServer(socket_path)
+        except (RuntimeError, OSError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+    results = {}
+    changed = None  # None reloads every file
+    try:
+        while True:
+            try:
+                secret_files, snapshot_name = select_secret_files(args, env_dirs)
+                file_paths = [file_path for _, _, file_path in secret_files]
+
+                # Files that failed last time are retried on every pass
+                reload_all = changed is None or any(root in changed for root in watcher.roots)
+                stale = [file_path for file_path in file_paths
+                         if reload_all or file_path in changed or results.get(file_path) is None]
+                for file_path, processed in zip(stale, load_secret_files(stale, args.jobs, cache, decryptor)):
+                    print(f"Processing {file_path}...")
+                    results[file_path] = processed
+
+                current = set(file_paths)
+                for file_path in [file_path for file_path in results if file_path not in current]:
+                    print(f"Dropping {file_path}")
+                    del results[file_path]
+
+                env_secrets = group_environments(secret_files, environments, [results[path] for path in file_paths])
+                digest = tree_digest(secret_files, key_identity)
+
+                write_outputs(env_secrets, args)
+                failed = [file_path for file_path in file_paths if results[file_path] is None]
+                if failed:
+                    # The digest only covers the ciphertext, so a snapshot missing these
+                    # files would be reused as complete until they change
+                    print(f"Error: could not decrypt {len(failed)} secret files, not saving or serving "
+                          f"a snapshot: {', '.join(failed)}")
+                else:
+                    if cache:
+                        cache.save_snapshot(snapshot_name, digest, env_secrets)
+                    if server:
+                        server.publish(watch_config(args), digest, env_secrets)
+            except OSError as e:
+                # Usually a file removed mid-refresh; the removal's own event triggers another pass
+                print(f"Warning: refresh incomplete: {e}")
+
+            where = f" and serving {socket_path}" if server else ""
+            print(f"Watching {len(results)} secret files for changes{where} (Ctrl-C to stop)")
+            changed = watcher.wait()
+    except KeyboardInterrupt:
+        print("Stopping watch")
+    finally:
+        if server:
+            server.close()
+        watcher.close()
+        if cache:
+            cache.evict()
+
+def run(args):
+    env_dirs = resolve_env_dirs(args)
+    cache = setup_cache(args)
+
+    if args.watch:
+        watch(args, env_dirs, cache)
+        return
+
+    profile = LoadProfile() if args.profile else None
+
+    def phase(name):
+        return profile.phase(name) if profile else nullcontext()
+
+    environments = [env for env, _ in env_dirs]
+    secret_files, snapshot_name = select_secret_files(args, env_dirs, profile)
+
+    with phase('digest'):
+        digest = tree_digest(secret_files, cache.key_identity) if cache else None
+    env_secrets = None
+
+    socket_path = watch_socket_path(args)
+    if not (args.no_cache or args.rebuild_cache) and socket_path and os.path.exists(socket_path):
+        with phase('socket'):
+            try:
+                served_digest = digest or tree_digest(secret_files, read_key_identity())
+                env_secrets = fetch_snapshot(socket_path, watch_config(args), served_digest)
+            except OSError:
+                pass
+        if env_secrets is not None:
+            print(f"Using the snapshot served by load_secrets --watch on {socket_path}")
+
+    if env_secrets is None and cache:
+        with phase('snapshot'):
+            env_secrets = cache.load_snapshot(snapshot_name, digest)
+        if env_secrets is not None:
+            print(f"Secrets tree unchanged (digest {digest[:12]}), reusing decrypted snapshot")
+
+    failed = []
+    if env_secrets is None:
+        with phase('decrypt'):
+            decryptor = setup_decryptor(args.backend)
+            env_secrets, failed = load_environments(secret_files, environments, args.jobs, cache, decryptor,
+                                                    profile)
+        # The digest only covers the ciphertext, so an incomplete snapshot would be reused until it expires
+        if cache and not failed:
+            with phase('snapshot'):
+                cache.save_snapshot(snapshot_name, digest, env_secrets)
+
+    with phase('serialize'):
+        write_outputs(env_secrets, args)
+
+    if cache:
+        with phase('evict'):
+            cache.evict()
+        print(f"Decryption cache: {cache.hits} hits, {cache.misses} misses")
+
+    if profile:
+        profile.write(args.profile)
+        profile.print_summary(args.profile_top)
+        print(f"Profile written to {args.profile}")
+
+    if failed:
+        print(f"Error: could not decrypt {len(failed)} secret files: {', '.join(failed)}")
+        sys.exit(1)
+
+def main():
+    args = parse_args()
+
+    if 'SOPS_AGE_KEY_FILE' not in os.environ:
+        print("Error: SOPS_AGE_KEY_FILE environment variable is not set")
+        sys.exit(1)
+
+    if args.jobs < 1:
+        print("Error: --jobs must be at least 1")
+        sys.exit(1)
+
+    if args.profile and args.watch:
+        print("Error: --profile times a single run and cannot be combined with --watch")
+        sys.exit(1)
+
+    profiler = cProfile.Profile() if args.cprofile else None
+    if profiler:
+        profiler.enable()
+    try:
+        run(args)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+            print(f"cProfile stats written to {args.cprofile} (inspect with: python3 -m pstats {args.cprofile})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+"""
+In-process decryption of SOPS files encrypted to age recipients.
+
+Does what `sops --decrypt` does for YAML/JSON documents without spawning a
+process per file: the age identities are parsed once, the data key is
+unwrapped from the `sops.age` stanzas, every ENC[] value is AES-GCM decrypted
+with its tree path as additional data and the document MAC is verified.
+
+The MAC is computed over values the way sops' ToBytes() renders them, not
+over the stored plaintext: booleans as True/False and floats in Go's
+shortest decimal form. Comments are not part of it; sops writes the ones it
+encrypts as YAML comments, which the parser drops, or as ENC[...,type:comment]
+list items, which are skipped.
+
+Anything outside that subset (other key types, Shamir key groups, multi
+document YAML, ...) raises UnsupportedFormatError so callers can fall back to
+the sops binary.
+"""
+
+import base64
+import decimal
+import hashlib
+import hmac
+import json
+import math
+import os
+import re
+
+from infralib import yaml_codec
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+    CRYPTOGRAPHY_AVAILABLE = True
+except ImportError:
+    CRYPTOGRAPHY_AVAILABLE = False
+
+
+class SopsDecryptError(Exception):
+    """Raised when a document cannot be decrypted or fails MAC verification"""
+    pass
+
+
+class UnsupportedFormatError(SopsDecryptError):
+    """Raised for documents this module does not handle; use the sops binary instead"""
+    pass
+
+
+AGE_INTRO = b"age-encryption.org/v1\n"
+AGE_ARMOR_BEGIN = "-----BEGIN AGE ENCRYPTED FILE-----"
+AGE_ARMOR_END = "-----END AGE ENCRYPTED FILE-----"
+AGE_SECRET_KEY_HRP = "age-secret-key-"
+AGE_CHUNK_SIZE = 64 * 1024
+AGE_TAG_SIZE = 16
+
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+BECH32_GENERATOR = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+
+# Same pattern the sops AES cipher uses to parse encrypted values
+ENC_VALUE_RE = re.compile(r'^ENC\[AES256_GCM,data:(.+),iv:(.+),tag:(.+),type:(.+)\]')
+
+# Metadata that needs a key source other than age
+UNSUPPORTED_METADATA = ('kms', 'gcp_kms', 'azure_kv', 'hc_vault', 'pgp', 'key_groups', 'shamir_threshold')
+
+# sops seeds the MAC with these bytes when it covers only encrypted values
+# (mac_only_encrypted), so it never equals the MAC over all values
+MAC_ONLY_ENCRYPTED_INIT = bytes.fromhex('8a3fd2ad54ce66527b1034f3d147be0b0b975b3bf44f72c6fdadec8176f27d69')
+
+BOOL_TRUE = ('1', 't', 'T', 'TRUE', 'true', 'True')
+BOOL_FALSE = ('0', 'f', 'F', 'FALSE', 'false', 'False')
+
+
+class CoreSchemaLoader(yaml_codec.SafeLoader):
+    """
+    Resolves plain scalars like the YAML library sops uses (YAML 1.2 core
+    schema) instead of YAML 1.1: `yes`/`on` stay strings and `1e-05` is a
+    float. Cleartext values enter the MAC as sops read them.
+    """
+
+
+CoreSchemaLoader.yaml_implicit_resolvers = {
+    first: [(tag, regexp) for tag, regexp in resolvers
+            if tag not in ('tag:yaml.org,2002:bool', 'tag:yaml.org,2002:int', 'tag:yaml.org,2002:float',
+                           'tag:yaml.org,2002:timestamp')]
+    for first, resolvers in yaml_codec.SafeLoader.yaml_implicit_resolvers.items()
+}
+CoreSchemaLoader.add_implicit_resolver(
+    'tag:yaml.org,2002:bool', re.compile(r'^(?:true|True|TRUE|false|False|FALSE)$'), list('tTfF'))
+CoreSchemaLoader.add_implicit_resolver(
+    'tag:yaml.org,2002:int', re.compile(r'^(?:[-+]?(?:0|[1-9][0-9]*)|0x[0-9a-fA-F]+)$'), list('-+0123456789'))
+CoreSchemaLoader.add_implicit_resolver(
+    'tag:yaml.org,2002:float',
+    re.compile(r'^(?:[-+]?(?:\.[0-9]+|[0-9]+(?:\.[0-9]*)?)(?:[eE][-+]?[0-9]+)?|[-+]?\.(?:inf|Inf|INF)|\.(?:nan|NaN|NAN))$'),
+    list('-+.0123456789'))
+
+
+def _bech32_polymod(values):
+    checksum = 1
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1ffffff) << 5 ^ value
+        for i, generator in enumerate(BECH32_GENERATOR):
+            if (top >> i) & 1:
+                checksum ^= generator
+    return checksum
+
+
+def _bech32_decode(encoded: str):
+    """Decode a bech32 string into (hrp, bytes); age keys exceed the BIP173 length limit"""
+    encoded = encoded.lower()
+    separator = encoded.rfind('1')
+    if separator < 1 or separator + 7 > len(encoded):
+        raise ValueError("Invalid bech32 string")
+
+    hrp = encoded[:separator]
+    data = [BECH32_CHARSET.find(c) for c in encoded[separator + 1:]]
+    if -1 in data:
+        raise ValueError("Invalid bech32 character")
+
+    expanded_hrp = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+    if _bech32_polymod(expanded_hrp + data) != 1:
+        raise ValueError("Invalid bech32 checksum")
+
+    # Regroup 5-bit words into bytes
+    acc = 0
+    bits = 0
+    decoded = bytearray()
+    for value in data[:-6]:
+        acc = (acc << 5) | value
+        bits += 5
+        if bits >= 8:
+            bits -= 8
+            decoded.append((acc >> bits) & 0xff)
+    if bits >= 5 or (acc << (8 - bits)) & 0xff:
+        raise ValueError("Invalid bech32 padding")
+
+    return hrp, bytes(decoded)
+
+
+def _b64decode_raw(data: bytes) -> bytes:
+    """Decode unpadded standard base64 as used in age headers"""
+    return base64.b64decode(data + b"=" * (-len(data) % 4), validate=True)
+
+
+def _hkdf_sha256(key: bytes, salt, info: bytes) -> bytes:
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=info).derive(key)
+
+
+class AgeIdentity:
+    """An X25519 age identity (AGE-SECRET-KEY-1...)"""
+
+    def __init__(self, secret_key: str):
+        hrp, key_bytes = _bech32_decode(secret_key)
+        if hrp != AGE_SECRET_KEY_HRP or len(key_bytes) != 32:
+            raise ValueError("Not an age X25519 secret key")
+
+        self.private_key = X25519PrivateKey.from_private_bytes(key_bytes)
+        self.public_bytes = self.private_key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+    def unwrap(self, share: bytes, body: bytes):
+        """Return the file key from an X25519 stanza, or None if it is not for this identity"""
+        shared_secret = self.private_key.exchange(X25519PublicKey.from_public_bytes(share))
+        if shared_secret == bytes(32):
+            raise SopsDecryptError("age X25519 stanza has a low order share")
+
+        wrap_key = _hkdf_sha256(shared_secret, share + self.public_bytes, b"age-encryption.org/v1/X25519")
+        try:
+            return ChaCha20Poly1305(wrap_key).decrypt(bytes(12), body, None)
+        except InvalidTag:
+            return None
+
+
+def parse_identities(text: str) -> list:
+    """Parse X25519 identities from age key file contents, skipping other identity types"""
+    identities = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('AGE-SECRET-KEY-1'):
+            identities.append(AgeIdentity(line))
+    return identities
+
+
+def _dearmor(armored: str) -> bytes:
+    text = armored.strip()
+    if not text.startswith(AGE_ARMOR_BEGIN) or not text.endswith(AGE_ARMOR_END):
+        raise UnsupportedFormatError("age payload is not ASCII armored")
+    body = text[len(AGE_ARMOR_BEGIN):-len(AGE_ARMOR_END)]
+    return base64.b64decode(''.join(body.split()), validate=True)
+
+
+def age_decrypt(armored: str, identities: list) -> bytes:
+    """Decrypt an armored age file with the first identity that unwraps its file key"""
+    data = _dearmor(armored)
+    if not data.startswith(AGE_INTRO):
+        raise UnsupportedFormatError("Unknown age format version")
+
+    pos = len(AGE_INTRO)
+    stanzas = []
+    while True:
+        end = data.find(b"\n", pos)
+        if end == -1:
+            raise SopsDecryptError("Truncated age header")
+        line_start, line = pos, data[pos:end]
+        pos = end + 1
+
+        if line.startswith(b"--- "):
+            header_mac = _b64decode_raw(line[4:])
+            header = data[:line_start + 3]
+            payload = data[pos:]
+            break
+        if not line.startswith(b"-> "):
+            raise SopsDecryptError("Malformed age header")
+
+        # Stanza bodies are wrapped at 64 columns and end with a shorter line
+        args = line[3:].split(b" ")
+        body = b""
+        while True:
+            end = data.find(b"\n", pos)
+            if end == -1:
+                raise SopsDecryptError("Truncated age stanza")
+            body_line = data[pos:end]
+            pos = end + 1
+            body += body_line
+            if len(body_line) < 64:
+                break
+        stanzas.append((args, _b64decode_raw(body)))
+
+    file_key = None
+    for args, body in stanzas:
+        if args[0] != b"X25519" or len(args) != 2:
+            continue
+        share = _b64decode_raw(args[1])
+        for identity in identities:
+            file_key = identity.unwrap(share, body)
+            if file_key:
+                break
+        if file_key:
+            break
+
+    if not file_key:
+        raise UnsupportedFormatError("No loaded age identity matches the file recipients")
+
+    mac_key = _hkdf_sha256(file_key, None, b"header")
+    if not hmac.compare_digest(hmac.new(mac_key, header, hashlib.sha256).digest(), header_mac):
+        raise SopsDecryptError("age header MAC mismatch")
+
+    nonce, ciphertext = payload[:16], payload[16:]
+    stream = ChaCha20Poly1305(_hkdf_sha256(file_key, nonce, b"payload"))
+    plaintext = bytearray()
+    chunk_size = AGE_CHUNK_SIZE + AGE_TAG_SIZE
+    counter = 0
+    offset = 0
+    while True:
+        chunk = ciphertext[offset:offset + chunk_size]
+        offset += len(chunk)
+        last = offset >= len(ciphertext)
+        chunk_nonce = counter.to_bytes(11, 'big') + (b"\x01" if last else b"\x00")
+        try:
+            plaintext += stream.decrypt(chunk_nonce, chunk, None)
+        except InvalidTag:
+            raise SopsDecryptError("age payload authentication failed")
+        if last:
+            return bytes(plaintext)
+        counter += 1
+
+
+def _is_comment(value) -> bool:
+    """Whether value is a comment sops encrypted into a list item"""
+    if not isinstance(value, str):
+        return False
+    match = ENC_VALUE_RE.match(value)
+    return bool(match) and match.group(4) == 'comment'
+
+
+def _decrypt_value(value: str, data_key: bytes, additional_data: str):
+    """Decrypt one ENC[] value; returns (python value, its bytes for the MAC)"""
+    if value == "":
+        return "", b""
+
+    match = ENC_VALUE_RE.match(value)
+    if not match:
+        raise SopsDecryptError(f"Value at '{additional_data}' is not in sops' data format")
+
+    data, iv, tag = (base64.b64decode(group) for group in match.group(1, 2, 3))
+    datatype = match.group(4)
+    try:
+        plaintext = AESGCM(data_key).decrypt(iv, data + tag, additional_data.encode())
+    except InvalidTag:
+        raise SopsDecryptError(f"Could not decrypt value at '{additional_data}'")
+
+    if datatype not in ('str', 'int', 'float', 'bool'):
+        raise UnsupportedFormatError(f"Unsupported sops datatype: {datatype}")
+
+    text = plaintext.decode()
+    if datatype == 'str':
+        return text, plaintext
+    try:
+        if datatype == 'int':
+            decrypted = int(text)
+        elif datatype == 'float':
+            decrypted = float(text)
+        elif text in BOOL_TRUE + BOOL_FALSE:
+            decrypted = text in BOOL_TRUE
+        else:
+            raise ValueError(text)
+    except ValueError:
+        raise SopsDecryptError(f"Invalid {datatype} at '{additional_data}'")
+    return decrypted, _to_mac_bytes(decrypted)
+
+
+def _format_float(value: float) -> str:
+    """strconv.FormatFloat(value, 'f', -1, 64): shortest round-trip digits, never an exponent"""
+    if not math.isfinite(value):
+        raise UnsupportedFormatError(f"Cannot compute MAC for float {value}")
+    return format(decimal.Decimal(repr(value)).normalize(), 'f')
+
+
+def _to_mac_bytes(value) -> bytes:
+    """Byte form sops' ToBytes() feeds into the MAC for a value"""
+    if isinstance(value, bool):
+        return b"True" if value else b"False"
+    if isinstance(value, int):
+        return str(value).encode()
+    if isinstance(value, float):
+        return _format_float(value).encode()
+    if isinstance(value, str):
+        return value.encode()
+    raise UnsupportedFormatError(f"Cannot compute MAC for cleartext value of type {type(value).__name__}")
+
+
+def load_document(file_path: str):
+    """Parse a still-encrypted .yaml/.yml/.json SOPS file"""
+    with open(file_path) as f:
+        content = f.read()
+
+    if file_path.endswith(('.yaml', '.yml')):
+        try:
+            return yaml_codec.load(content, loader=CoreSchemaLoader)
+        except yaml_codec.ComposerError:
+            raise UnsupportedFormatError("Multi-document YAML")
+    elif file_path.endswith('.json'):
+        return json.loads(content)
+    raise UnsupportedFormatError(f"Unsupported file format: {file_path}")
+
+
+class SopsDecryptor:
+    """Decrypts SOPS YAML/JSON documents with a fixed set of age identities"""
+
+    def __init__(self, identities: list):
+        if not identities:
+            raise ValueError("No age X25519 identities loaded")
+        self.identities = identities
+
+    @classmethod
+    def from_environment(cls) -> 'SopsDecryptor':
+        """Load identities once from SOPS_AGE_KEY_FILE and/or SOPS_AGE_KEY"""
+        if not CRYPTOGRAPHY_AVAILABLE:
+            raise ImportError("In-process sops decryption requires the 'cryptography' package")
+
+        identities = []
+        key_file = os.environ.get('SOPS_AGE_KEY_FILE')
+        if key_file:
+            with open(key_file) as f:
+                identities.extend(parse_identities(f.read()))
+        identities.extend(parse_identities(os.environ.get('SOPS_AGE_KEY', '')))
+        return cls(identities)
+
+    def decrypt_file(self, file_path: str):
+        """Return the decrypted document for a .yaml/.yml/.json file"""
+        return self.decrypt_document(load_document(file_path))
+
+    def decrypt_document(self, document: dict) -> dict:
+        if not isinstance(document, dict) or not isinstance(document.get('sops'), dict):
+            raise SopsDecryptError("Document has no sops metadata")
+
+        metadata = document['sops']
+        if any(metadata.get(name) for name in UNSUPPORTED_METADATA):
+            raise UnsupportedFormatError("Document uses key sources other than age")
+        if not isinstance(metadata.get('lastmodified'), str):
+            raise UnsupportedFormatError("Missing or non-string lastmodified")
+
+        data_key = self._data_key(metadata)
+        is_encrypted = self._encryption_rule(metadata)
+        mac_only_encrypted = bool(metadata.get('mac_only_encrypted'))
+        mac = hashlib.sha512(MAC_ONLY_ENCRYPTED_INIT if mac_only_encrypted else b"")
+
+        def walk(value, path):
+            if isinstance(value, dict):
+                decrypted = {}
+                for key, item in value.items():
+                    if not isinstance(key, str):
+                        raise UnsupportedFormatError("Non-string mapping key")
+                    decrypted[key] = walk(item, path + [key])
+                return decrypted
+            if isinstance(value, list):
+                # List items share their parent's path
+                return [walk(item, path) for item in value if not _is_comment(item)]
+            if value is None:
+                # sops leaves nulls as they are and they add nothing to the MAC
+                return None
+
+            if is_encrypted(path):
+                if not isinstance(value, str):
+                    raise SopsDecryptError(f"Expected encrypted value at '{':'.join(path)}'")
+                decrypted, plaintext = _decrypt_value(value, data_key, ':'.join(path) + ':')
+                mac.update(plaintext)
+                return decrypted
+
+            if not mac_only_encrypted:
+                mac.update(_to_mac_bytes(value))
+            return value
+
+        result = walk({key: value for key, value in document.items() if key != 'sops'}, [])
+
+        stored_mac, _ = _decrypt_value(metadata.get('mac', ''), data_key, metadata['lastmodified'])
+        if not hmac.compare_digest(stored_mac, mac.hexdigest().upper()):
+            raise SopsDecryptError("MAC mismatch: document was modified or decrypted incorrectly")
+
+        return result
+
+    def _data_key(self, metadata: dict) -> bytes:
+        recipients = metadata.get('age') or []
+        if not recipients:
+            raise UnsupportedFormatError("Document has no age recipients")
+
+        for recipient in recipients:
+            try:
+                return age_decrypt(recipient['enc'], self.identities)
+            except UnsupportedFormatError:
+                continue
+        raise UnsupportedFormatError("None of the document's age recipients match the loaded identities")
+
+    @staticmethod
+    def _encryption_rule(metadata: dict):
+        """Build the same per-path encrypted/cleartext decision sops makes"""
+        unencrypted_suffix = metadata.get('unencrypted_suffix')
+        encrypted_suffix = metadata.get('encrypted_suffix')
+        unencrypted_regex = metadata.get('unencrypted_regex')
+        encrypted_regex = metadata.get('encrypted_regex')
+        if metadata.get('unencrypted_comment_regex') or metadata.get('encrypted_comment_regex'):
+            raise UnsupportedFormatError("Comment encryption rules are not supported")
+
+        unencrypted_re = re.compile(unencrypted_regex) if unencrypted_regex else None
+        encrypted_re = re.compile(encrypted_regex) if encrypted_regex else None
+
+        def is_encrypted(path):
+            encrypted = True
+            if unencrypted_suffix and any(p.endswith(unencrypted_suffix) for p in path):
+                encrypted = False
+            if encrypted_suffix:
+                encrypted = any(p.endswith(encrypted_suffix) for p in path)
+            if unencrypted_re and any(unencrypted_re.search(p) for p in path):
+                encrypted = False
+            if encrypted_re:
+                encrypted = any(encrypted_re.search(p) for p in path)
+            return encrypted
+
+        return is_encrypted
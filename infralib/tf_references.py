@@ -0,0 +1,211 @@
+"""
+Find which vault paths an OpenTofu stack reads from local.secrets_json.
+
+The scan is purely textual and errs on the side of loading more: any use
+of the secrets map it cannot pin down to literal paths or prefixes marks the
+whole tree as needed.
+"""
+
+import os
+import re
+from glob import glob
+
+ROOT_LOCAL = 'secrets_json'
+
+BLOCK_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+LINE_COMMENT_RE = re.compile(r'^\s*(#|//).*$', re.M)
+LOCALS_BLOCK_RE = re.compile(r'^\s*locals\s*\{', re.M)
+ALIAS_RE = re.compile(r'^\s*(\w+)\s*=\s*local\.(\w+)\s*$', re.M)
+LOCAL_REF_RE = re.compile(r'local\.(\w+)\b')
+INDEX_RE = re.compile(r'\s*\[\s*"((?:[^"\\]|\\.)*)"\s*\]')
+FOR_IN_RE = re.compile(r'for\s+(\w+)\s*,\s*\w+\s+in\s+$')
+STARTSWITH_RE = r'\s*startswith\(\s*{var}\s*,\s*"([^"$]+)"\s*\)\s*'
+IF_RE = re.compile(r'\bif\b')
+# A loop result that is one bracketed expression (contents masked out), and a for at its start
+NESTED_RESULT_RE = re.compile(r'\s*([\[{])\s*[\]}]\s*')
+INNER_FOR_RE = re.compile(r'\s*(for)\s')
+BRACKETS = {'{': '}', '[': ']', '(': ')'}
+
+
+class SecretReferences:
+    """Vault paths and path prefixes referenced by a stack"""
+
+    def __init__(self):
+        self.paths = set()
+        self.prefixes = set()
+        self.everything = False
+        self.reasons = []
+
+    def matches(self, vault_path: str) -> bool:
+        return (self.everything
+                or vault_path in self.paths
+                or any(vault_path.startswith(prefix) for prefix in self.prefixes))
+
+    def require_everything(self, reason: str):
+        self.everything = True
+        self.reasons.append(reason)
+
+
+def _strip_comments(text: str) -> str:
+    return LINE_COMMENT_RE.sub('', BLOCK_COMMENT_RE.sub('', text))
+
+
+def _locals_spans(source: str) -> list:
+    """(start, end) offsets of every `locals { ... }` block"""
+    spans = []
+    for match in LOCALS_BLOCK_RE.finditer(source):
+        depth = 0
+        for pos in range(match.end() - 1, len(source)):
+            if source[pos] == '{':
+                depth += 1
+            elif source[pos] == '}':
+                depth -= 1
+                if depth == 0:
+                    spans.append((match.end(), pos))
+                    break
+    return spans
+
+
+def _mask(text: str) -> str:
+    """
+    text with the contents of string literals and nested brackets blanked
+    out, so that only its top-level syntax is left at the same offsets
+    """
+    masked = []
+    depth = 0
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+                masked.append(ch if depth == 0 else ' ')
+                continue
+            masked.append(' ')
+            continue
+        if ch in BRACKETS:
+            masked.append(ch if depth == 0 else ' ')
+            depth += 1
+        elif ch in BRACKETS.values():
+            depth -= 1
+            masked.append(ch if depth == 0 else ' ')
+        else:
+            if ch == '"':
+                in_string = True
+            masked.append(ch if depth == 0 else ' ')
+    return ''.join(masked)
+
+
+def _for_condition(source: str, loop_start: int):
+    """
+    The `if` condition of the for expression whose `for` keyword is at
+    loop_start: '' when it has none, None when its enclosing { } or [ ]
+    cannot be found. When the loop's whole result is another for
+    expression, as in `[for path, data in m : [for k, v in data : v if
+    startswith(path, "...")]]`, that loop's condition is returned: keys it
+    filters out produce nothing.
+    """
+    open_pos = len(source[:loop_start].rstrip()) - 1
+    if open_pos < 0 or source[open_pos] not in '{[':
+        return None
+    masked = _mask(source[open_pos:])
+    close = masked.find(BRACKETS[source[open_pos]], 1)
+    if close < 0:
+        return None
+    body = source[open_pos + 1:open_pos + close]
+    masked_body = _mask(body)
+    condition = IF_RE.search(masked_body)
+    if condition:
+        return body[condition.end():], masked_body[condition.end():]
+
+    colon = masked_body.find(':')
+    result = NESTED_RESULT_RE.fullmatch(masked_body, colon + 1) if colon >= 0 else None
+    inner = result and INNER_FOR_RE.match(body, result.start(1) + 1)
+    if inner:
+        return _for_condition(source, open_pos + 1 + inner.start(1))
+    return ''
+
+
+def _loop_prefixes(condition: tuple, var: str) -> set:
+    """
+    Prefixes every key kept by an `if` condition must start with, or an
+    empty set unless the condition is an AND of terms of which at least
+    one is startswith(var, "...")
+    """
+    text, masked = condition
+    if '||' in masked or '?' in masked:
+        return set()
+    pattern = re.compile(STARTSWITH_RE.format(var=re.escape(var)))
+    prefixes = set()
+    start = 0
+    for end in [match.start() for match in re.finditer('&&', masked)] + [len(masked)]:
+        term = pattern.fullmatch(text, start, end)
+        if term:
+            prefixes.add(term.group(1))
+        start = end + 2
+    # Any one startswith() term bounds the AND; more of them only narrow it further
+    return set(sorted(prefixes, key=len)[-1:]) if prefixes else set()
+
+
+def scan_stack(tf_dir: str) -> SecretReferences:
+    """Collect secrets_json references from the .tf files directly in tf_dir"""
+    tf_files = sorted(glob(os.path.join(tf_dir, '*.tf')))
+    if not tf_files:
+        raise FileNotFoundError(f"No .tf files found in {tf_dir}")
+
+    sources = {}
+    for tf_file in tf_files:
+        with open(tf_file) as f:
+            sources[tf_file] = _strip_comments(f.read())
+
+    # Locals that are just another name for the secrets map, e.g. vault_secrets
+    aliases = {ROOT_LOCAL}
+    alias_definitions = set()
+    changed = True
+    while changed:
+        changed = False
+        for tf_file, source in sources.items():
+            spans = _locals_spans(source)
+            for match in ALIAS_RE.finditer(source):
+                if not any(start <= match.start() < end for start, end in spans):
+                    continue
+                if match.group(2) in aliases:
+                    alias_definitions.add((tf_file, match.start(2)))
+                    if match.group(1) not in aliases:
+                        aliases.add(match.group(1))
+                        changed = True
+
+    refs = SecretReferences()
+    for tf_file, source in sources.items():
+        for match in LOCAL_REF_RE.finditer(source):
+            if match.group(1) not in aliases or (tf_file, match.start(1)) in alias_definitions:
+                continue
+
+            line = source.count('\n', 0, match.start()) + 1
+            location = f"{os.path.basename(tf_file)}:{line}"
+
+            index = INDEX_RE.match(source, match.end())
+            if index:
+                key = index.group(1)
+                if '${' in key:
+                    refs.prefixes.add(key.split('${', 1)[0])
+                else:
+                    refs.paths.add(key)
+                continue
+
+            # `{ for path, data in local.secrets_json : ... if startswith(path, "...") }`
+            line_start = source.rfind('\n', 0, match.start()) + 1
+            loop = FOR_IN_RE.search(source, line_start, match.start())
+            if loop:
+                condition = _for_condition(source, loop.start())
+                prefixes = _loop_prefixes(condition, loop.group(1)) if condition else set()
+                if prefixes:
+                    refs.prefixes.update(prefixes)
+                    continue
+
+            refs.require_everything(f"local.{match.group(1)} used as a whole map at {location}")
+
+    return refs
@@ -0,0 +1,172 @@
+"""
+KV v2 access shared by the kubeconfig updaters and secrets_extract.py.
+
+KVStore reads and writes secrets through one hvac client and remembers the
+data and version of every secret it read, for the life of the process, so
+a read followed by an update of the same secret costs one round trip, not
+two. Writes drop the remembered entry. store(client) returns the KVStore
+of a client, so every caller holding the client shares the cache.
+
+Parallel CI jobs merge their clusters into the same kubeconfig secret. A
+plain read-then-write drops whatever another job wrote in between, so
+KVStore.update() pins each write to the version it read (the KV v2 `cas`
+option) and, when Vault rejects it because the secret moved on, reads the
+new version, applies the change to it again and retries after a jittered
+exponential backoff - the same loop ip_pool_manager.sh runs for IP
+allocations. A stale cache entry therefore costs one conflict, never a
+lost update.
+"""
+
+import random
+import threading
+import time
+import weakref
+
+import hvac
+
+# Error Vault returns when the cas option does not match the current version
+CAS_MISMATCH = 'check-and-set parameter did not match'
+
+
+class CASConflictError(Exception):
+    """The secret kept changing under us until the retries ran out"""
+
+
+def split_path(vault_path: str) -> tuple:
+    """'mount_point/secret/path' -> ('mount_point', 'secret/path')"""
+    if '/' not in vault_path:
+        raise ValueError(f"Invalid vault path format: {vault_path}. Expected: mount_point/secret_path")
+    mount_point, secret_path = vault_path.split('/', 1)
+    return mount_point, secret_path
+
+
+def is_cas_conflict(error: Exception) -> bool:
+    return isinstance(error, hvac.exceptions.InvalidRequest) and CAS_MISMATCH in str(error)
+
+
+class KVStore:
+    """KV v2 reads and check-and-set writes through one client, with a per-path cache"""
+
+    def __init__(self, client: hvac.Client):
+        self.client = client
+        # (mount_point, path) -> (version, data) of the current version
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, path: str, mount_point: str = 'kv', version: int = None, cache: bool = True) -> tuple:
+        """
+        (data, version) of the secret's current version, or of `version`.
+        ({}, 0) when it does not exist and ({}, version) when that version
+        is deleted, so the version can be used as the cas of the next write.
+        cache=False reads without remembering the data, for callers that
+        stream many secrets through once.
+        """
+        data, version, _ = self._read(path, mount_point, version, cache)
+        return data, version
+
+    def _read(self, path: str, mount_point: str, version: int = None, cache: bool = True) -> tuple:
+        """read() plus whether the answer came from the cache"""
+        key = (mount_point, path)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and version in (None, cached[0]):
+                self.hits += 1
+                return dict(cached[1]), cached[0], True
+            self.misses += 1
+
+        try:
+            response = self.client.secrets.kv.v2.read_secret_version(
+                path=path,
+                version=version,
+                mount_point=mount_point,
+                raise_on_deleted_version=False
+            )
+        except hvac.exceptions.InvalidPath:
+            response = None
+        secret = (response or {}).get('data') or {}
+        data = dict(secret.get('data') or {})
+        read_version = int((secret.get('metadata') or {}).get('version') or 0)
+
+        # A pinned version may be older than the current one; only cache reads of the latest
+        if cache and version is None:
+            with self._lock:
+                self._cache[key] = (read_version, data)
+            data = dict(data)
+        return data, read_version, False
+
+    def metadata(self, path: str, mount_point: str = 'kv') -> dict:
+        """KV v2 metadata of path (current_version, versions, ...)"""
+        return self.client.secrets.kv.v2.read_secret_metadata(path=path, mount_point=mount_point)['data']
+
+    def write(self, path: str, data: dict, mount_point: str = 'kv', cas: int = None) -> dict:
+        """Write a new version, only over version `cas` when given; returns the new version's metadata"""
+        try:
+            response = self.client.secrets.kv.v2.create_or_update_secret(
+                path=path,
+                secret=data,
+                cas=cas,
+                mount_point=mount_point
+            )
+        finally:
+            # Whether it was written or refused, the cached version is no longer current
+            self.invalidate(path, mount_point)
+        return (response or {}).get('data') or {}
+
+    def invalidate(self, path: str = None, mount_point: str = 'kv'):
+        """Forget a path, or everything"""
+        with self._lock:
+            if path is None:
+                self._cache.clear()
+            else:
+                self._cache.pop((mount_point, path), None)
+
+    def update(self, path: str, update, mount_point: str = 'kv', max_retries: int = 10,
+               base_delay: float = 0.1, max_delay: float = 5.0, logger=None) -> dict:
+        """
+        Replace a secret's data with update(current data), written only if
+        nobody else wrote the secret since it was read. The first attempt
+        starts from the cached read when there is one. update() is called
+        again on fresh data after every conflict, so it must not have side
+        effects; it returns None to leave the secret as it is. Returns the
+        data written, or None when nothing was written.
+        """
+        for attempt in range(max_retries + 1):
+            data, version, cached = self._read(path, mount_point)
+            new_data = update(data)
+            if new_data is None and cached:
+                # Only leave the secret alone on what Vault holds now, not on what we remember
+                self.invalidate(path, mount_point)
+                data, version, _ = self._read(path, mount_point)
+                new_data = update(data)
+            if new_data is None:
+                return None
+            try:
+                self.write(path, new_data, mount_point, cas=version)
+                return new_data
+            except hvac.exceptions.InvalidRequest as e:
+                if not is_cas_conflict(e):
+                    raise
+                if attempt == max_retries:
+                    raise CASConflictError(f"{mount_point}/{path} changed concurrently "
+                                           f"{max_retries + 1} times in a row") from e
+            # Full jitter spreads out writers that collided on the same version
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if logger:
+                logger.warning(f"CAS conflict on {mount_point}/{path} at version {version}, "
+                               f"retrying ({attempt + 1}/{max_retries}) in {delay:.2f}s")
+            time.sleep(delay)
+
+
+_stores = weakref.WeakKeyDictionary()
+_stores_lock = threading.Lock()
+
+
+def store(client: hvac.Client) -> KVStore:
+    """The KVStore of client, created on first use and shared by every caller"""
+    with _stores_lock:
+        kv = _stores.get(client)
+        if kv is None:
+            kv = _stores[client] = KVStore(client)
+        return kv
@@ -0,0 +1,190 @@
+"""
+Rate-limited, retrying access to Vault for the bulk scripts.
+
+RequestScheduler combines three controls so that many workers get the most
+throughput Vault allows without losing requests:
+
+- a token bucket caps the request rate (optional),
+- an AIMD window caps requests in flight: it grows by one for each full
+  window of successes and halves when Vault throttles (429/503),
+- failed requests are retried with full-jitter exponential backoff. Any
+  request is retried when throttled, since Vault rejected it unprocessed;
+  other transient failures are only retried for idempotent reads.
+
+ScheduledAdapter plugs the scheduler under every hvac call, so callers keep
+using hvac.Client as usual and only see an exception once retries run out.
+"""
+
+import random
+import threading
+import time
+
+import hvac
+import requests
+from requests.adapters import HTTPAdapter
+
+# HTTP methods hvac issues that never change Vault state
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'LIST'}
+
+# Vault refused the request before processing it: rate limit quota, sealed or standby node
+THROTTLED_ERRORS = (hvac.exceptions.RateLimitExceeded, hvac.exceptions.VaultDown)
+
+# Failures that may succeed on a second attempt
+TRANSIENT_ERRORS = (
+    hvac.exceptions.InternalServerError,
+    hvac.exceptions.BadGateway,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+
+class TokenBucket:
+    """Allow `rate` acquisitions per second on average, in bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: float = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AIMDLimiter:
+    """
+    Concurrency window with additive increase and multiplicative decrease.
+
+    Each success adds 1/limit, so the window grows by one per window of
+    successes. A throttled request halves it, but only once per generation:
+    requests that were already in flight when the window shrank cannot
+    shrink it again.
+    """
+
+    def __init__(self, maximum: int, initial: int = None, minimum: int = 1, decrease: float = 0.5):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.decrease = decrease
+        self.limit = float(initial or maximum)
+        self.in_flight = 0
+        self._generation = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> int:
+        """Wait for a free slot; returns a ticket to pass to release()"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            return self._generation
+
+    def release(self, ticket: int, throttled: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                if ticket == self._generation:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._generation += 1
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class RequestScheduler:
+    """Run calls under a token bucket and an AIMD window, retrying throttled and transient failures"""
+
+    def __init__(self, max_concurrency: int = 8, rate: float = None, burst: float = None,
+                 max_retries: int = 6, base_delay: float = 0.25, max_delay: float = 30.0):
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.limiter = AIMDLimiter(max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self._stats_lock = threading.Lock()
+
+    def _count(self, retried=False, throttled=False):
+        with self._stats_lock:
+            self.requests += 1
+            self.retries += retried
+            self.throttled += throttled
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform between 0 and the capped exponential delay"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, *args, idempotent: bool = True, **kwargs):
+        attempt = 0
+        while True:
+            if self.bucket:
+                self.bucket.acquire()
+            ticket = self.limiter.acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except THROTTLED_ERRORS:
+                self.limiter.release(ticket, throttled=True)
+                retry = attempt < self.max_retries
+                self._count(retried=retry, throttled=True)
+                if not retry:
+                    raise
+            except TRANSIENT_ERRORS:
+                self.limiter.release(ticket)
+                retry = idempotent and attempt < self.max_retries
+                self._count(retried=retry)
+                if not retry:
+                    raise
+            except BaseException:
+                self.limiter.release(ticket)
+                self._count()
+                raise
+            else:
+                self.limiter.release(ticket)
+                self._count()
+                return result
+
+            time.sleep(self.backoff(attempt))
+            attempt += 1
+
+    def summary(self) -> str:
+        return (f"{self.requests} Vault requests, {self.retries} retried, {self.throttled} throttled, "
+                f"concurrency window {int(self.limiter.limit)}/{self.limiter.maximum}")
+
+
+class ScheduledAdapter(hvac.adapters.JSONAdapter):
+    """hvac adapter that sends every request through a RequestScheduler"""
+
+    def __init__(self, *args, scheduler: RequestScheduler = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler or RequestScheduler()
+
+    def request(self, method, url, *args, **kwargs):
+        return self.scheduler.call(super().request, method, url, *args,
+                                   idempotent=method.upper() in IDEMPOTENT_METHODS, **kwargs)
+
+
+def vault_client(url: str, token: str, scheduler: RequestScheduler = None, pool_size: int = None) -> hvac.Client:
+    """
+    hvac.Client whose requests go through `scheduler`, on a session whose
+    connection pool fits the scheduler's concurrency so no worker waits
+    for (or reopens) a connection
+    """
+    scheduler = scheduler or RequestScheduler()
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size or scheduler.limiter.maximum, 1))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return hvac.Client(url=url, token=token, session=session, adapter=ScheduledAdapter, scheduler=scheduler)
@@ -0,0 +1,55 @@
+"""
+YAML parsing and emitting shared by the infra scripts.
+
+Uses PyYAML's LibYAML bindings (CSafeLoader/CSafeDumper) when PyYAML was
+built with them and the pure-Python SafeLoader/SafeDumper otherwise. Both
+accept and produce the same documents; the C versions are several times
+faster on large kubeconfigs and secret trees.
+
+Also usable from shell scripts, with the repository root on PYTHONPATH:
+
+    python3 -m infralib.yaml_codec to-json < kubeconfig.yaml
+    python3 -m infralib.yaml_codec to-yaml < kubeconfig.json
+"""
+
+import json
+import sys
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+    LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+    LIBYAML = False
+
+YAMLError = yaml.YAMLError
+# Raised by load() when the input holds more than one document
+ComposerError = yaml.composer.ComposerError
+
+
+def load(stream, loader=None):
+    """Parse a single YAML document from a string or file"""
+    return yaml.load(stream, Loader=loader or SafeLoader)
+
+
+def dump(data, stream=None, dumper=None, **kwargs):
+    """Emit data in block style; returns a string when no stream is given"""
+    kwargs.setdefault('default_flow_style', False)
+    return yaml.dump(data, stream, Dumper=dumper or SafeDumper, **kwargs)
+
+
+def main():
+    commands = {
+        'to-json': lambda: json.dump(load(sys.stdin), sys.stdout),
+        'to-yaml': lambda: dump(json.load(sys.stdin), sys.stdout, sort_keys=False),
+    }
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        print(f"Usage: python3 -m infralib.yaml_codec <{'|'.join(commands)}>", file=sys.stderr)
+        sys.exit(2)
+    commands[sys.argv[1]]()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,9 +10,13 @@ import logging
 import argparse
 from pathlib import Path
 
+# The repository root, for infralib; a copy run elsewhere needs PYTHONPATH set to it instead
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
 try:
-    import yaml
     import hvac
+    from infralib import vault_kv, yaml_codec
+    from infralib.vault_scheduler import vault_client
 except ImportError as e:
     print(f"Missing required dependency: {e}")
     print("Install with: pip install pyyaml hvac")
@@ -42,7 +46,8 @@ class KubeconfigUpdater:
             return self.client
 
         try:
-            self.client = hvac.Client(url=self.vault_addr, token=self.vault_token)
+            # Requests are rate limited and retried on 429/5xx by the shared scheduler
+            self.client = vault_client(self.vault_addr, self.vault_token)
             if not self.client.is_authenticated():
                 raise Exception("Failed to authenticate to Vault")
             self.logger.info("Successfully authenticated to Vault")
@@ -61,34 +66,32 @@ class KubeconfigUpdater:
 
         return content
 
-    def get_vault_secret(self, vault_path: str, key: str = "KUBECONFIG") -> str:
-        """Get existing kubeconfig from Vault"""
-        client = self._get_vault_client()
-
-        # Parse vault path (mount_point/secret_path)
-        if '/' not in vault_path:
-            raise ValueError(f"Invalid vault path format: {vault_path}. Expected: mount_point/secret_path")
+    def _get_kv_store(self) -> vault_kv.KVStore:
+        """Cached KV v2 access through the Vault client"""
+        return vault_kv.store(self._get_vault_client())
 
-        mount_point, secret_path = vault_path.split('/', 1)
+    def get_vault_secret(self, vault_path: str, key: str = "KUBECONFIG") -> str:
+        """
+        Get existing kubeconfig from Vault. The read is cached for the
+        process, so publishing right after it does not read the secret again.
+        """
+        mount_point, secret_path = vault_kv.split_path(vault_path)
 
         try:
             self.logger.info(f"Reading secret from {vault_path}")
-            secret = client.secrets.kv.v2.read_secret_version(
-                path=secret_path,
-                mount_point=mount_point
-            )
-
-            if secret and 'data' in secret and 'data' in secret['data']:
-                kubeconfig = secret['data']['data'].get(key)
-                if kubeconfig:
-                    self.logger.info("Found existing kubeconfig in Vault")
-                    return kubeconfig
-
-        except hvac.exceptions.InvalidPath:
-            self.logger.info("No existing secret found - will create new one")
+            data, version = self._get_kv_store().read(secret_path, mount_point)
         except Exception as e:
-            self.logger.warning(f"Error reading from Vault: {e}")
+            # Treating a failed read as "no existing secret" would overwrite
+            # the stored kubeconfig and drop every other cluster from it
+            self.logger.error(f"Error reading from Vault: {e}")
+            raise
 
+        if not version:
+            self.logger.info("No existing secret found - will create new one")
+        kubeconfig = data.get(key)
+        if kubeconfig:
+            self.logger.info("Found existing kubeconfig in Vault")
+            return kubeconfig
         return None
 
     def merge_kubeconfig(self, existing: str, new: str, cluster_name: str, inventory_name: str) -> str:
@@ -98,8 +101,8 @@ class KubeconfigUpdater:
             return new
 
         try:
-            existing_yaml = yaml.safe_load(existing)
-            new_yaml = yaml.safe_load(new)
+            existing_yaml = yaml_codec.load(existing)
+            new_yaml = yaml_codec.load(new)
 
             # Update names in new config
             for section in ['clusters', 'contexts', 'users']:
@@ -139,43 +142,25 @@ class KubeconfigUpdater:
                 existing_yaml['current-context'] = inventory_name
 
             self.logger.info(f"Successfully merged config for cluster: {cluster_name}")
-            return yaml.dump(existing_yaml, default_flow_style=False)
+            return yaml_codec.dump(existing_yaml)
 
         except Exception as e:
             self.logger.error(f"Error merging configs: {e}")
             self.logger.info("Using new config only")
             return new
 
-    def update_vault_secret(self, vault_path: str, kubeconfig: str, key: str = "KUBECONFIG") -> bool:
-        """Update kubeconfig in Vault secret"""
-        client = self._get_vault_client()
-
-        # Parse vault path
-        mount_point, secret_path = vault_path.split('/', 1)
-
+    def publish_kubeconfig(self, vault_path: str, key: str, build) -> bool:
+        """
+        Store build(existing kubeconfig or None) under key in the Vault
+        secret, keeping its other keys. Starts from the cached read of the
+        secret when there is one. The write is pinned to the version read;
+        when another updater wrote in between, the secret is read again and
+        build() re-applied to it.
+        """
         try:
-            # Get existing secret data to preserve other keys
-            secret_data = {key: kubeconfig}
-
-            try:
-                existing = client.secrets.kv.v2.read_secret_version(
-                    path=secret_path,
-                    mount_point=mount_point
-                )
-                if existing and 'data' in existing and 'data' in existing['data']:
-                    existing_data = existing['data']['data']
-                    existing_data.update(secret_data)
-                    secret_data = existing_data
-            except hvac.exceptions.InvalidPath:
-                pass  # Secret doesn't exist, use new data
-
-            # Write secret
-            client.secrets.kv.v2.create_or_update_secret(
-                path=secret_path,
-                secret=secret_data,
-                mount_point=mount_point
-            )
-
+            mount_point, secret_path = vault_kv.split_path(vault_path)
+            self._get_kv_store().update(secret_path, lambda data: {**data, key: build(data.get(key))},
+                                        mount_point, logger=self.logger)
             self.logger.info(f"Successfully updated secret at {vault_path}")
             return True
 
@@ -183,6 +168,10 @@ class KubeconfigUpdater:
             self.logger.error(f"Failed to update Vault secret: {e}")
             return False
 
+    def update_vault_secret(self, vault_path: str, kubeconfig: str, key: str = "KUBECONFIG") -> bool:
+        """Update kubeconfig in Vault secret, keeping its other keys"""
+        return self.publish_kubeconfig(vault_path, key, lambda existing: kubeconfig)
+
     def update_kubeconfig(self, kubeconfig_file: str, vault_path: str,
                          cluster_name: str, inventory_name: str,
                          vault_key: str = "KUBECONFIG") -> bool:
@@ -191,14 +180,11 @@ class KubeconfigUpdater:
             # Read new kubeconfig
             new_config = self.read_kubeconfig_file(kubeconfig_file)
 
-            # Get existing config from Vault
-            existing_config = self.get_vault_secret(vault_path, vault_key)
-
-            # Merge configs
-            merged_config = self.merge_kubeconfig(existing_config, new_config, cluster_name, inventory_name)
-
-            # Update Vault
-            return self.update_vault_secret(vault_path, merged_config, vault_key)
+            # Merge into whatever version of the secret is current when writing
+            return self.publish_kubeconfig(
+                vault_path, vault_key,
+                lambda existing: self.merge_kubeconfig(existing, new_config, cluster_name, inventory_name)
+            )
 
         except Exception as e:
             self.logger.error(f"Update failed: {e}")
@@ -2,16 +2,51 @@
 """
 Script to extract secrets from HashiCorp Vault and save them as YAML files for SOPS encryption.
 This is a one-time extraction to initialize your Git-stored encrypted secrets.
+With --encrypt the files are written already encrypted by sops, so no plaintext
+copy lands on disk and secrets_encrypt.sh is not needed.
 """
 
 import os
+import re
 import sys
 import json
-import yaml
 import hvac
+import queue
 import argparse
+import tempfile
+import subprocess
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 
+from infralib import vault_kv, yaml_codec
+from infralib.vault_scheduler import RequestScheduler, vault_client
+
+# Bump when the manifest layout changes
+MANIFEST_VERSION = 1
+
+# Environment routing used without --routing; the first matching rule wins
+DEFAULT_ROUTES = {
+    'routes': [
+        {'regex': '(?i)/dev/', 'environment': 'dev'},
+        {'regex': '(?i)/stg/|staging', 'environment': 'stg'},
+        {'regex': '(?i)/prod/|production', 'environment': 'prod'},
+    ],
+    # Shared across environments
+    'default': 'common',
+}
+
+# One secret to extract: keys is where its data sits below vault.kv in output_file
+Job = namedtuple('Job', 'path env output_file keys version')
+
+# print() writes the text and the newline separately; workers share this lock so lines never interleave
+_print_lock = threading.Lock()
+
+def log(message):
+    with _print_lock:
+        print(message)
+
 def parse_args():
     parser = argparse.ArgumentParser(description='Extract secrets from Vault to YAML files')
     parser.add_argument('--vault-addr', default=os.environ.get('VAULT_ADDR', 'https://vault.toolz.homelabz.eu'),
@@ -24,120 +59,432 @@ def parse_args():
                       help='Environment to extract (dev, stg, prod, all)')
     parser.add_argument('--dryrun', action='store_true',
                       help='Print paths but do not extract secrets')
+    parser.add_argument('--plan', action='store_true',
+                      help='List paths and print the extraction layout per environment, without reading any secret')
+    parser.add_argument('--routing',
+                      help='YAML file of ordered prefix/regex rules mapping paths to environments (default: built-in rules)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                      help='Number of directories to list and secrets to fetch in parallel (default: 1)')
+    parser.add_argument('--rate', type=float,
+                      help='Maximum Vault requests per second (default: unlimited, only backing off when throttled)')
+    parser.add_argument('--max-retries', type=int, default=6,
+                      help='Retries per Vault request on 429/5xx before giving up (default: 6)')
+    parser.add_argument('--prefix', default='',
+                      help='Only extract paths under this prefix, with or without the mount (e.g. kv/cluster-secret-store/)')
+    parser.add_argument('--max-depth', type=int,
+                      help='Do not list directories more than this many levels below the prefix')
+    parser.add_argument('--incremental', action='store_true',
+                      help='Only fetch secrets whose KV v2 version changed since the run recorded in --manifest')
+    parser.add_argument('--manifest', default='secrets_extract_manifest.json',
+                      help='Path/version manifest used by --incremental (keep it outside the secrets directory)')
+    parser.add_argument('--encrypt', action='store_true',
+                      help='Stream secrets through sops and write them already encrypted for the .sops.yaml recipients')
+    parser.add_argument('--encrypt-jobs', type=int, default=os.cpu_count() or 1,
+                      help='Number of sops processes running at once with --encrypt (default: CPU count)')
+    parser.add_argument('--queue-size', type=int, default=64,
+                      help='Secrets held in memory between pipeline stages with --encrypt (default: 64)')
     return parser.parse_args()
 
-def setup_vault_client(vault_addr, vault_token):
-    client = hvac.Client(url=vault_addr, token=vault_token)
+def setup_vault_client(vault_addr, vault_token, scheduler):
+    # One client and session shared by all workers; the scheduler paces them
+    # and retries requests Vault throttles or fails transiently
+    client = vault_client(vault_addr, vault_token, scheduler)
     if not client.is_authenticated():
         print(f"Failed to authenticate to Vault at {vault_addr}")
         sys.exit(1)
     print(f"Successfully authenticated to Vault at {vault_addr}")
     return client
 
-def get_secrets_paths(client, mount_point='kv'):
-    """Get all secret paths in the given mount point"""
-    try:
-        # List all paths at the root of the KV store
-        paths = []
-        # This is a recursive function to get all paths
-        def list_recursive(path=""):
-            try:
-                # For KV v2, use the metadata endpoint
-                list_response = client.secrets.kv.v2.list_secrets(
-                    path=path,
-                    mount_point=mount_point
-                )
-                keys = list_response.get('data', {}).get('keys', [])
+def normalize_prefix(prefix, mount_point='kv'):
+    """Strip the mount from prefix; return it and the directory the crawl starts from"""
+    if prefix.startswith(f"{mount_point}/"):
+        prefix = prefix[len(mount_point) + 1:]
+    return prefix, prefix[:prefix.rfind('/') + 1]
+
+def crawl_secrets_paths(client, mount_point='kv', prefix='', max_depth=None, concurrency=1, errors=None):
+    """
+    Yield every secret path under prefix in the given mount point as soon as
+    its directory has been listed.
+
+    Directories are crawled breadth-first through the KV v2 metadata
+    endpoint, with up to `concurrency` list calls in flight. Directories
+    that cannot be listed are recorded in `errors` as {directory: error}.
+    """
+    prefix, start = normalize_prefix(prefix, mount_point)
+
+    def list_directory(path):
+        try:
+            list_response = client.secrets.kv.v2.list_secrets(
+                path=path,
+                mount_point=mount_point
+            )
+        except hvac.exceptions.InvalidPath:
+            return []  # Empty or missing directory
+        return list_response.get('data', {}).get('keys', [])
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = {executor.submit(list_directory, start): (start, 0)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory, depth = pending.pop(future)
+                try:
+                    keys = future.result()
+                except Exception as e:
+                    log(f"Error listing {mount_point}/{directory}: {e}")
+                    if errors is not None:
+                        errors[directory] = e
+                    continue
+
                 for key in keys:
+                    full_path = f"{directory}{key}"
+                    if not full_path.startswith(prefix):
+                        continue
                     # If key ends with /, it's a directory
                     if key.endswith('/'):
-                        list_recursive(f"{path}{key}" if path else key)
+                        if max_depth is None or depth < max_depth:
+                            pending[executor.submit(list_directory, full_path)] = (full_path, depth + 1)
                     else:
-                        full_path = f"{path}{key}" if path else key
-                        paths.append(full_path)
-            except Exception as e:
-                # If we get an error, this might be a leaf node
-                pass
+                        yield full_path
 
-        list_recursive()
-        return paths
-    except Exception as e:
-        print(f"Error listing secret paths: {e}")
-        return []
+def get_secrets_paths(client, mount_point='kv', prefix='', max_depth=None, concurrency=1):
+    """
+    List every secret path under prefix in the given mount point. Returns the
+    sorted paths and a {directory: error} map of directories that could not
+    be listed, so a partial listing is never mistaken for a full one.
+    """
+    errors = {}
+    paths = sorted(crawl_secrets_paths(client, mount_point, prefix, max_depth, concurrency, errors))
+    return paths, errors
 
-def get_secret(client, path, mount_point='kv'):
-    """Get a secret from Vault at the given path"""
+def get_secret(client, path, mount_point='kv', version=None):
+    """
+    Get a secret from Vault at the given path, at a specific version if
+    given. Returns None when the read fails, as opposed to {} for a secret
+    that holds no data.
+    """
     try:
-        # For KV v2
-        secret = client.secrets.kv.v2.read_secret_version(
-            path=path,
-            mount_point=mount_point
-        )
-        return secret.get('data', {}).get('data', {})
+        # Each secret is read once and streamed to disk, so keep its data out of the cache
+        data, _ = vault_kv.store(client).read(path, mount_point, version=version, cache=False)
+        # Deleted since it was listed, or its current version is soft-deleted: {}
+        return data
     except Exception as e:
-        print(f"Error reading secret at {path}: {e}")
+        log(f"Error reading secret at {path}: {e}")
+        return None
+
+def get_secret_metadata(client, path, mount_point='kv'):
+    """
+    Return (current_version, updated_time, live) from the KV v2 metadata of
+    path; `live` is False when the current version is deleted or destroyed.
+    """
+    metadata = vault_kv.store(client).metadata(path, mount_point)
+    current_version = metadata['current_version']
+    version = metadata.get('versions', {}).get(str(current_version), {})
+    live = not version.get('deletion_time') and not version.get('destroyed')
+    return current_version, metadata.get('updated_time'), live
+
+def load_manifest(manifest_file):
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        print(f"Ignoring {manifest_file}: unknown manifest version {manifest.get('version')}")
         return {}
+    return manifest.get('secrets', {})
+
+def save_manifest(entries, manifest_file):
+    """Write the manifest atomically so an interrupted run leaves the previous one intact"""
+    manifest_dir = os.path.dirname(manifest_file) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=manifest_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'secrets': entries}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        os.replace(tmp_path, manifest_file)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
-def save_to_yaml(data, output_file, environment):
+def nest_secret(data, keys):
+    """Build the vault.kv.<keys> document, e.g. keys ('app', 'dev', 'db') -> vault.kv.app.dev.db"""
+    nested_data = {'vault': {'kv': {}}}
+    current = nested_data['vault']['kv']
+    for part in keys[:-1]:
+        current[part] = {}
+        current = current[part]
+    current[keys[-1]] = data
+    return nested_data
+
+def save_to_yaml(data, output_file, keys):
     """Save structured data to a YAML file"""
     # Ensure parent directories exist
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
 
-    # Parse the path to determine the structure
-    parts = output_file.replace('.yaml', '').split('/')
-    path_parts = parts[2:]  # Skip 'secrets/dev' prefix
-
-    # Create nested structure
-    nested_data = {}
-    current = nested_data
-
-    # Add standard structure
-    # Example: 'cluster-secret-store/secrets/KUBECONFIG'
-    # would become vault: { kv: { cluster-secret-store: { secrets: { KUBECONFIG: value } } } }
-
-    # Start with vault.kv
-    current['vault'] = {'kv': {}}
-    current = current['vault']['kv']
-
-    # # Handle special cases like individual keys in cluster-secret-store/secrets
-    # if len(path_parts) >= 2 and path_parts[0] == 'cluster-secret-store' and path_parts[1] == 'secrets':
-    #     # Check if we're dealing with a specific key or the whole secrets map
-    #     if len(path_parts) == 3:
-    #         # Individual key like KUBECONFIG
-    #         key_name = path_parts[2]
-    #         current['cluster-secret-store'] = {'secrets': {key_name: data[key_name]}}
-    #     else:
-    #         # The whole secrets map
-    #         current['cluster-secret-store'] = {'secrets': data}
-    # else:
-        # Standard nested path
-    for i, part in enumerate(path_parts):
-        if i == len(path_parts) - 1:
-            # Last part, assign the data
-            current[part] = data
-        else:
-            # Intermediate path part
-            current[part] = {}
-            current = current[part]
-
     # Write to file
     with open(output_file, 'w') as f:
-        yaml.dump(nested_data, f, default_flow_style=False)
-
-    print(f"Saved secrets to {output_file}")
-
-def determine_environment(path):
-    """Try to determine which environment a secret belongs to"""
-    # Add your own logic here based on your naming conventions
-    if '/dev/' in path.lower():
-        return 'dev'
-    elif '/stg/' in path.lower() or 'staging' in path.lower():
-        return 'stg'
-    elif '/prod/' in path.lower() or 'production' in path.lower():
-        return 'prod'
-    else:
-        # Default to common (shared across environments)
-        return 'common'
+        yaml_codec.dump(nest_secret(data, keys), f)
+
+    log(f"Saved secrets to {output_file}")
+
+def encrypt_to_file(data, output_file):
+    """
+    Encrypt a document with sops and write only the ciphertext to output_file.
+    The plaintext goes to sops over a pipe and never touches the disk. sops
+    runs in the output directory and is told the output file's name, so it
+    finds the nearest .sops.yaml and applies the creation rule for that
+    file itself, as `sops --encrypt` run on the file would.
+    """
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    os.makedirs(output_dir, exist_ok=True)
+    plaintext = yaml_codec.dump(data)
+    result = subprocess.run(
+        ['sops', '--encrypt', '--filename-override', os.path.abspath(output_file),
+         '--input-type', 'yaml', '--output-type', 'yaml', '/dev/stdin'],
+        input=plaintext,
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=output_dir
+    )
+
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(result.stdout)
+        os.replace(tmp_path, output_file)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def run_pipeline(client, jobs, fetchers=1, encryptors=1, queue_size=64):
+    """
+    Stream Jobs through fetch, nest and encrypt stages.
+
+    `jobs` may be a lazy iterator such as the crawler, so listing overlaps
+    with fetching. Fetch workers read secrets from Vault while encrypt
+    workers nest and encrypt them with sops. The stages are joined by
+    bounded queues, so a slow stage blocks the one feeding it instead of
+    piling up secrets in memory. Returns {path: written}, where written
+    means the same as the return value of extract_secret().
+    """
+    fetch_queue = queue.Queue(maxsize=queue_size)
+    encrypt_queue = queue.Queue(maxsize=queue_size)
+    results = {}
+
+    def fetch_worker():
+        while True:
+            job = fetch_queue.get()
+            if job is None:
+                return
+            path = job.path
+            log(f"Processing {path} (environment: {job.env})")
+            secret_data = get_secret(client, path, version=job.version)
+            if not secret_data:
+                if secret_data is not None:
+                    log(f"  No data found for {path}")
+                results[path] = None if secret_data is None else False
+                continue
+            encrypt_queue.put((job, secret_data))
+
+    def encrypt_worker():
+        while True:
+            item = encrypt_queue.get()
+            if item is None:
+                return
+            job, secret_data = item
+            path, output_file = job.path, job.output_file
+            try:
+                encrypt_to_file(nest_secret(secret_data, job.keys), output_file)
+            except subprocess.CalledProcessError as e:
+                log(f"Error encrypting {path}: {e.stderr.strip()}")
+                results[path] = None
+            except Exception as e:
+                # Keep draining: a worker that died would leave the fetchers
+                # blocked on a full encrypt_queue
+                log(f"Error encrypting {path}: {e}")
+                results[path] = None
+            else:
+                log(f"Saved encrypted secrets to {output_file}")
+                results[path] = True
+
+    fetch_threads = [threading.Thread(target=fetch_worker) for _ in range(fetchers)]
+    encrypt_threads = [threading.Thread(target=encrypt_worker) for _ in range(encryptors)]
+    for thread in fetch_threads + encrypt_threads:
+        thread.start()
+
+    try:
+        for job in jobs:
+            fetch_queue.put(job)
+    finally:
+        for _ in fetch_threads:
+            fetch_queue.put(None)
+        for thread in fetch_threads:
+            thread.join()
+        for _ in encrypt_threads:
+            encrypt_queue.put(None)
+        for thread in encrypt_threads:
+            thread.join()
+
+    return results
+
+def extract_secret(client, path, env, output_file, keys, version=None):
+    """
+    Fetch one secret and write its YAML file; safe to run from several
+    threads at once. Returns True when written, False when the secret holds
+    no data and None when it could not be read.
+    """
+    log(f"Processing {path} (environment: {env})")
+
+    secret_data = get_secret(client, path, version=version)
+    if secret_data is None:
+        return None
+    if not secret_data:
+        log(f"  No data found for {path}")
+        return False
+
+    save_to_yaml(secret_data, output_file, keys)
+    return True
+
+def plan_incremental(client, jobs, manifest, concurrency=1):
+    """
+    Compare the KV v2 metadata of each job's path with the manifest.
+
+    Returns the jobs to fetch, pinned to their current version, the
+    manifest entries to record once they are written, the paths whose
+    current version is deleted and the paths whose metadata could not be
+    read. The manifest entries of the latter survive until a later run can
+    check them.
+    """
+    def read_metadata(path):
+        try:
+            return get_secret_metadata(client, path)
+        except hvac.exceptions.InvalidPath:
+            return None  # Removed after it was listed
+        except Exception as e:
+            log(f"Error reading metadata for {path}: {e}")
+            return e
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(read_metadata, [job.path for job in jobs]))
+
+    changed = []
+    entries = {}
+    deleted = []
+    failed = []
+    for job, result in zip(jobs, results):
+        path, output_file = job.path, job.output_file
+        if isinstance(result, Exception):
+            failed.append(path)
+            continue
+        if result is None or not result[2]:
+            deleted.append(path)
+            continue
+
+        current_version, updated_time, _ = result
+        previous = manifest.get(path, {})
+        if (previous.get('current_version') == current_version
+                and previous.get('output_file') == output_file
+                and os.path.exists(output_file)):
+            continue
+
+        changed.append(job._replace(version=current_version))
+        entries[path] = {'current_version': current_version, 'updated_time': updated_time,
+                         'output_file': output_file}
+
+    return changed, entries, deleted, failed
+
+class Router:
+    """
+    Ordered environment rules, compiled once. A rule matches on a literal
+    `prefix` or on a `regex` searched anywhere in the path; the first
+    matching rule wins and unmatched paths go to `default`.
+    """
+
+    def __init__(self, config):
+        self.rules = []
+        for rule in config.get('routes') or []:
+            if not rule.get('environment') or ('prefix' in rule) == ('regex' in rule):
+                raise ValueError(f"Each route needs an environment and exactly one of prefix or regex: {rule}")
+            if 'prefix' in rule:
+                matches = re.compile(re.escape(rule['prefix'])).match
+            else:
+                matches = re.compile(rule['regex']).search
+            self.rules.append((matches, rule['environment']))
+        self.default = config.get('default', 'common')
+
+    def environment(self, path):
+        for matches, env in self.rules:
+            if matches(path):
+                return env
+        return self.default
+
+    def job(self, path, output_dir, version=None):
+        env = self.environment(path)
+        return Job(path, env, f"{output_dir}/{env}/{path}.yaml", tuple(path.split('/')), version)
+
+def load_router(routing_file=None):
+    """Router for routing_file, or for DEFAULT_ROUTES without one"""
+    if not routing_file:
+        return Router(DEFAULT_ROUTES)
+    with open(routing_file) as f:
+        config = yaml_codec.load(f) or {}
+    if not isinstance(config, dict):
+        raise ValueError(f"{routing_file} must be a mapping with 'routes' and optionally 'default'")
+    return Router(config)
+
+def print_plan(jobs, listed):
+    """Print where each selected secret would be written, grouped by environment"""
+    by_env = {}
+    for job in jobs:
+        by_env.setdefault(job.env, []).append(job)
+
+    for env in sorted(by_env):
+        print(f"{env}: {len(by_env[env])} secrets")
+        for job in by_env[env]:
+            print(f"  {job.path} -> {job.output_file}")
+    print(f"Plan: {len(jobs)} of {listed} listed secrets would be extracted")
+
+def extract_streaming(client, args, router):
+    """List, fetch and encrypt in one pass: secrets are fetched while the crawl is still listing directories"""
+    list_errors = {}
+    listed = []
+
+    def jobs():
+        for path in crawl_secrets_paths(client, prefix=args.prefix, max_depth=args.max_depth,
+                                        concurrency=args.concurrency, errors=list_errors):
+            listed.append(path)
+            job = router.job(path, args.output_dir)
+            if args.environment != 'all' and job.env != args.environment:
+                continue
+            yield job
+
+    print("Listing and extracting secrets from Vault...")
+    results = run_pipeline(client, jobs(), args.concurrency, args.encrypt_jobs, args.queue_size)
+
+    if not listed:
+        print("No secrets found or error occurred")
+        sys.exit(1)
+
+    print(f"Found {len(listed)} secret paths, encrypted {sum(1 for written in results.values() if written)} "
+          f"of {len(results)} selected")
+    finish(results, list_errors, client.adapter.scheduler)
+
+def finish(results, list_errors, scheduler):
+    """Report Vault traffic and every secret or directory that failed; exit 1 if anything did"""
+    print(scheduler.summary())
+    failed = sorted(path for path, written in results.items() if written is None)
+    if failed:
+        print(f"Failed to extract {len(failed)} secrets: {', '.join(failed)}")
+    if list_errors:
+        print(f"Listing failed for: {', '.join(sorted(list_errors))}")
+    if failed or list_errors:
+        print("Done, with errors")
+        sys.exit(1)
+
+    print("Done!")
 
 def main():
     args = parse_args()
@@ -146,44 +493,106 @@ def main():
         print("Error: No Vault token provided. Set VAULT_TOKEN env var or use --vault-token")
         sys.exit(1)
 
-    client = setup_vault_client(args.vault_addr, args.vault_token)
+    if args.concurrency < 1:
+        print("Error: --concurrency must be at least 1")
+        sys.exit(1)
+
+    if args.encrypt_jobs < 1 or args.queue_size < 1:
+        print("Error: --encrypt-jobs and --queue-size must be at least 1")
+        sys.exit(1)
+
+    try:
+        router = load_router(args.routing)
+    except (OSError, ValueError, re.error, yaml_codec.YAMLError) as e:
+        print(f"Error: invalid --routing file: {e}")
+        sys.exit(1)
+
+    scheduler = RequestScheduler(max_concurrency=args.concurrency, rate=args.rate, max_retries=args.max_retries)
+    client = setup_vault_client(args.vault_addr, args.vault_token, scheduler)
+
+    if args.encrypt and not (args.incremental or args.dryrun or args.plan):
+        extract_streaming(client, args, router)
+        return
 
     # Get all secret paths
     print("Listing secret paths from Vault...")
-    paths = get_secrets_paths(client)
+    paths, list_errors = get_secrets_paths(client, prefix=args.prefix, max_depth=args.max_depth,
+                                           concurrency=args.concurrency)
 
     if not paths:
         print("No secrets found or error occurred")
         sys.exit(1)
 
     print(f"Found {len(paths)} secret paths")
+    if list_errors:
+        print(f"Warning: {len(list_errors)} directories could not be listed, their secrets are not extracted")
 
-    # Process each path
-    for path in paths:
-        # Determine which environment this secret belongs to
-        env = determine_environment(path)
+    # Route every path to its environment and output file once
+    selected = [job for job in (router.job(path, args.output_dir) for path in paths)
+                if args.environment == 'all' or job.env == args.environment]
 
-        # Skip if not requested environment
-        if args.environment != 'all' and env != args.environment:
-            continue
+    if args.plan:
+        print_plan(selected, len(paths))
+        if list_errors:
+            print(f"Listing failed for: {', '.join(sorted(list_errors))}")
+            sys.exit(1)
+        return
 
-        print(f"Processing {path} (environment: {env})")
+    if args.incremental:
+        manifest = load_manifest(args.manifest)
+        total = len(selected)
+        selected, updated_entries, deleted, metadata_failed = plan_incremental(client, selected, manifest,
+                                                                               args.concurrency)
 
-        if args.dryrun:
-            print(f"  Would extract to {args.output_dir}/{env}/{path}.yaml")
-            continue
+        # Paths the manifest knows about that this run should have listed but did not
+        prefix, start = normalize_prefix(args.prefix)
+        def in_scope(path):
+            if not path.startswith(prefix):
+                return False
+            if args.max_depth is not None and path[len(start):].count('/') > args.max_depth:
+                return False
+            if args.environment != 'all' and router.environment(path) != args.environment:
+                return False
+            return not any(path.startswith(directory) for directory in list_errors)
 
-        # Get the secret
-        secret_data = get_secret(client, path)
-        if not secret_data:
-            print(f"  No data found or error occurred for {path}")
-            continue
+        listed = set(paths)
+        deleted = sorted(set(deleted) | {path for path in manifest if path not in listed and in_scope(path)})
 
-        # Save to YAML
-        output_file = f"{args.output_dir}/{env}/{path}.yaml"
-        save_to_yaml(secret_data, output_file, env)
+        print(f"{len(selected)} of {total} secrets changed and {len(deleted)} deleted since the last run")
+        for path in deleted:
+            output_file = manifest.get(path, {}).get('output_file')
+            print(f"  Deleted in Vault: {path}" + (f" (local file {output_file} left in place)" if output_file else ""))
 
-    print("Done!")
+    results = {}
+    if args.incremental:
+        results.update(dict.fromkeys(metadata_failed))
+
+    if args.dryrun:
+        for job in selected:
+            print(f"Processing {job.path} (environment: {job.env})")
+            print(f"  Would extract to {job.output_file}")
+    else:
+        # Every path has its own output file, so workers never write the same file
+        if args.encrypt:
+            results.update(run_pipeline(client, selected, args.concurrency,
+                                        args.encrypt_jobs, args.queue_size))
+        elif args.concurrency == 1:
+            results.update({job.path: extract_secret(client, *job) for job in selected})
+        else:
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                written = executor.map(lambda job: extract_secret(client, *job), selected)
+                results.update(zip([job.path for job in selected], written))
+
+        if args.incremental:
+            entries = {path: entry for path, entry in manifest.items() if path not in deleted}
+            for path, written in results.items():
+                # Failed reads keep their old entry so the next run retries them
+                if written:
+                    entries[path] = updated_entries[path]
+            save_manifest(entries, args.manifest)
+            print(f"Manifest updated: {args.manifest}")
+
+    finish(results, list_errors, scheduler)
 
 if __name__ == "__main__":
     main()